@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# Headless batch mode: process many Met object IDs the same way as the /metid page, streaming the
+# QuickStatements, memo diagnostics and a Commons upload manifest to files as objects complete.
+# Completed IDs are checkpointed, so re-running the same command after a crash resumes where it
+# left off.
+#
+#   python batch.py --range 1 50000 --out output/run1
+#   python batch.py --file ids.txt --out output/run2 --workers 8
+#   python batch.py --department "European Paintings" --out output/paintings
+#   python batch.py --csv MetObjects.csv --out output/full   # offline, from the Open Access dump
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+import yaml
+
+import httpclient
+
+metapi_root = 'https://collectionapi.metmuseum.org/public/collection/v1/'
+
+# Subjects that must not be sent to QuickStatements as-is
+unsafe_subjects = ('TOOMANY', 'UNCHECKED')
+
+
+# A result built while some of its remote calls failed (see process_metid), so it is not written
+class IncompleteResult(Exception):
+    pass
+
+
+def load_config():
+    with open(os.path.join(os.path.dirname(__file__), 'config.yaml')) as f:
+        return yaml.safe_load(f)
+
+
+def ids_from_range(start, end):
+    return range(start, end + 1)
+
+
+def ids_from_file(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield int(line)
+
+
+def ids_from_department(name, timeout=60):
+    departments = httpclient.get(metapi_root + 'departments', timeout=timeout).json()['departments']
+    matched = [d['departmentId'] for d in departments if d['displayName'] == name]
+    if not matched:
+        raise ValueError('Unknown Met department: {}'.format(name))
+    r = httpclient.get(metapi_root + 'objects', params={'departmentIds': matched[0]}, timeout=timeout)
+    r.raise_for_status()
+    return sorted(r.json()['objectIDs'] or [])
+
+
+# IDs already completed by an earlier run writing to out
+def read_checkpoint(out):
+    if not os.path.exists(out + '.done'):
+        return set()
+    with open(out + '.done') as f:
+        return {int(line) for line in f if line.strip()}
+
+
+class BatchOutput:
+    # Writes <out>.qs.txt, <out>.memo.jsonl, the <out>.uploads.jsonl manifest of public domain images
+    # to upload to Commons, and the <out>.done checkpoint of completed IDs. With a store (a
+    # resultstore.ResultStore), each object is also recorded there under the file name of out.
+    def __init__(self, out, store=None):
+        directory = os.path.dirname(out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.done_path = out + '.done'
+        self.done = read_checkpoint(out)
+        self.qs_file = open(out + '.qs.txt', 'a', encoding='utf-8')
+        self.memo_file = open(out + '.memo.jsonl', 'a', encoding='utf-8')
+        self.uploads_file = open(out + '.uploads.jsonl', 'a', encoding='utf-8')
+        self.done_file = open(self.done_path, 'a')
+        self.results = store.writer(os.path.basename(out)) if store else None
+
+    def write(self, result):
+        emitted = is_emittable(result)
+        if emitted and result['qs']:
+            self.qs_file.write('\n'.join(result['qs']) + '\n')
+        self.memo_file.write(json.dumps({'id': result['id'],
+                                         'qid': result.get('qid'),
+                                         'qs_subject': result.get('qs_subject'),
+                                         'emitted': emitted,
+                                         'memo': result['memo']}) + '\n')
+        if result.get('upload'):
+            self.uploads_file.write(json.dumps(result['upload']) + '\n')
+        self.qs_file.flush()
+        self.memo_file.flush()
+        self.uploads_file.flush()
+        if self.results:
+            self.results.write(result)
+        # Only checkpoint once the outputs for this object are on disk
+        self.done_file.write('{}\n'.format(result['id']))
+        self.done_file.flush()
+        self.done.add(result['id'])
+
+    def close(self):
+        self.qs_file.close()
+        self.memo_file.close()
+        self.uploads_file.close()
+        self.done_file.close()
+        if self.results:
+            self.results.close()
+
+
+def is_emittable(result):
+    return bool(result.get('data')) and 'objectID' in result['data'] and \
+        result.get('qs_subject') not in unsafe_subjects
+
+
+# Run process over ids with at most workers * 2 objects in flight, rather than submitting every ID
+# up front. Yields (id, result, exception) in completion order, with exception None on success.
+def process_iter(ids, process, workers=4):
+    max_pending = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        ids = iter(ids)
+        exhausted = False
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    id = next(ids, None)
+                    if id is None:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(process, id)] = id
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    id = pending.pop(future)
+                    error = future.exception()
+                    yield id, None if error else future.result(), error
+        finally:
+            # The consumer stopped early (e.g. a client disconnected), so drop what has not started
+            for future in pending:
+                future.cancel()
+
+
+# on_written, if given, is called with each result once it is on disk and checkpointed, and on_failed
+# with the ID and exception of each object that could not be processed. Once stop (a threading.Event)
+# is set, the run ends without writing the results still in flight.
+def run(ids, out, process, workers=4, progress=None, on_written=None, on_failed=None, store=None, stop=None):
+    output = BatchOutput(out, store)
+    processed = failed = 0
+    try:
+        for id, result, error in process_iter((id for id in ids if id not in output.done), process, workers):
+            if stop is not None and stop.is_set():
+                break
+            if error is None and result.get('failed'):
+                error = IncompleteResult('request failed: {}'.format(', '.join(result['failed'])))
+            if error is not None:
+                # Left out of the checkpoint, so a re-run retries it
+                failed += 1
+                print('{}: failed ({}: {})'.format(id, type(error).__name__, error), file=sys.stderr)
+                if on_failed:
+                    on_failed(id, error)
+                continue
+            output.write(result)
+            if on_written:
+                on_written(result)
+            processed += 1
+            if progress:
+                progress(processed, failed)
+    finally:
+        output.close()
+    return processed, failed
+
+
+# Offline pass over the Met Open Access CSV dump: no Met API calls, and Wikidata matches come from
+# the local Met ID index. Objects are only emitted if the index has had a full sweep, since
+# otherwise a missing Met ID does not mean there is no item for it.
+def run_csv(path, out, lookup, index, reconciler=None, chunksize=10000, progress=None, fetch_claims=None,
+            store=None):
+    from metcsv import read_chunks
+    from transform import transform_object
+
+    checked = index.is_built()
+    output = BatchOutput(out, store)
+    processed = 0
+    try:
+        for chunk in read_chunks(path, chunksize):
+            chunk = [data for data in chunk if data.get('objectID') not in output.done]
+            found = index.lookup_many(data.get('objectID') for data in chunk)
+            # Reconcile the chunk's distinct artist names in batched requests. Without them, the
+            # chunk's objects get no creator (P170).
+            artists = {}
+            if reconciler:
+                try:
+                    artists = reconciler.reconcile_many(data.get('artistDisplayName') for data in chunk)
+                except requests.RequestException as e:
+                    print('Could not reconcile artists, leaving out creators: {}'.format(e), file=sys.stderr)
+            # Current claims of the chunk's existing items, so only missing statements are emitted.
+            # Without them, items are diffed against the indexed properties only.
+            claims = {}
+            if fetch_claims:
+                existing = [qid for matches in found.values() if len(matches) == 1 for qid in matches]
+                try:
+                    claims = fetch_claims(existing)
+                except requests.RequestException as e:
+                    print('Could not fetch claims, using the index: {}'.format(e), file=sys.stderr)
+            for data in chunk:
+                id = data.get('objectID')
+                matches = found.get(str(id))
+                result = transform_object(id, data, lookup=lookup, matches=matches, checked=checked,
+                                          artist_candidates=artists.get(data.get('artistDisplayName')),
+                                          claims=claims.get(next(iter(matches))) if matches else None)
+                result['data'] = data
+                output.write(result)
+                processed += 1
+                if progress:
+                    progress(processed, 0)
+    finally:
+        output.close()
+    return processed, 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate QuickStatements for many Met object IDs')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--range', nargs=2, type=int, metavar=('START', 'END'))
+    source.add_argument('--file', help='file with one Met object ID per line')
+    source.add_argument('--department', help='Met department display name, e.g. "European Paintings"')
+    source.add_argument('--csv', help='path to the MetObjects.csv Open Access dump')
+    parser.add_argument('--out', required=True, help='output path prefix')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-recon', action='store_true', help='with --csv, skip artist reconciliation')
+    parser.add_argument('--no-claims', action='store_true',
+                        help='with --csv, diff existing items against the index instead of fetching their claims')
+    parser.add_argument('--no-store', action='store_true',
+                        help='do not record the processed objects in the result store (see resultstore.py)')
+    args = parser.parse_args()
+    config = load_config()
+    httpclient.configure(config)
+    __dir__ = os.path.dirname(__file__)
+    store = None
+    if not args.no_store:
+        from resultstore import ResultStore
+        store = ResultStore(os.path.join(__dir__, config['RESULTS_PATH']))
+
+    def report(processed, failed):
+        if processed % 100 == 0:
+            print('{} processed, {} failed'.format(processed, failed), file=sys.stderr)
+
+    if args.csv:
+        from claims import fetch_claims
+        from crosswalk import CrosswalkCache, objectname_crosswalk_page, wikidata_api_url
+        from metindex import MetIndex
+        from recon import ReconCache, Reconciler
+
+        # Trust an existing crosswalk snapshot as-is, only fetching the page if there is none
+        crosswalk_cache = CrosswalkCache(wikidata_api_url, objectname_crosswalk_page,
+                                         snapshot_path=os.path.join(__dir__, config['CROSSWALK_SNAPSHOT']),
+                                         ttl=float('inf'))
+        index = MetIndex(os.path.join(__dir__, config['METINDEX_PATH']))
+        if not index.is_built():
+            print('Warning: Met ID index has not been swept, so no QuickStatements will be emitted. '
+                  'Run: python metindex.py sweep', file=sys.stderr)
+        reconciler = None
+        if not args.no_recon:
+            reconciler = Reconciler(ReconCache(os.path.join(__dir__, config['RECON_CACHE_PATH'])),
+                                    api_url=config['RECON_API_URL'], batch_size=config['RECON_BATCH_SIZE'],
+                                    type=config['RECON_TYPE'])
+        processed, failed = run_csv(args.csv, args.out, crosswalk_cache.get_lookup(), index, reconciler,
+                                    progress=report, fetch_claims=None if args.no_claims else fetch_claims,
+                                    store=store)
+    else:
+        if args.range:
+            object_ids = ids_from_range(*args.range)
+        elif args.file:
+            object_ids = ids_from_file(args.file)
+        else:
+            object_ids = ids_from_department(args.department)
+
+        # Imported here so --help does not pay for loading the app
+        from app import process_metid
+
+        processed, failed = run(object_ids, args.out, process_metid, workers=args.workers, progress=report,
+                                store=store)
+    print('Done: {} processed, {} failed'.format(processed, failed), file=sys.stderr)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# End-to-end benchmark of the /metid view and the batch modes against local fake services (see
+# fakeservices.py), so numbers are repeatable and comparable across commits.
+#
+#   python benchmarks/bench_app.py                          # all scenarios, default latencies
+#   python benchmarks/bench_app.py --json before.json       # save results
+#   python benchmarks/bench_app.py --compare before.json    # ... and diff a later run against them
+#   python benchmarks/bench_app.py --latency sparql=0.5 --latency met=0
+#
+# Scenarios:
+#   metid_cold   GET /metid/<id> for IDs never seen before, so every cache misses
+#   metid_warm   the same IDs again, served from the Met response/index/recon caches
+#   batch        batch.run over a range of IDs with process_metid
+#   batch_csv    batch.run_csv over a generated Open Access CSV dump
+
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(__dir__, '..'))
+
+from fakeservices import FakeServices, default_latency  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def latency_summary(seconds):
+    return {'requests': len(seconds),
+            'mean_ms': 1000 * sum(seconds) / len(seconds),
+            'p50_ms': 1000 * percentile(seconds, 0.5),
+            'p95_ms': 1000 * percentile(seconds, 0.95),
+            'max_ms': 1000 * max(seconds)}
+
+
+# Run a scenario, adding its wall time and peak Python allocations to the results it returns
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result.update({'seconds': elapsed, 'peak_alloc_mb': peak / 2 ** 20})
+    return result
+
+
+def bench_metid(app, ids):
+    client = app.app.test_client()
+    seconds = []
+    for id in ids:
+        start = time.perf_counter()
+        response = client.get('/metid/{}'.format(id))
+        seconds.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError('/metid/{} returned {}'.format(id, response.status_code))
+    return latency_summary(seconds)
+
+
+def bench_batch(app, ids, out, workers):
+    import batch
+
+    processed, failed = batch.run(ids, out, app.process_metid, workers=workers)
+    return {'objects': processed, 'failed': failed}
+
+
+def write_csv(services, path, rows):
+    from metcsv import csv_api_fields
+
+    columns = list(csv_api_fields)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for id in range(1, rows + 1):
+            status, data = services.met_object_for(id)
+            if status != 200:
+                continue
+            writer.writerow(['|'.join(data[field]) if isinstance(data.get(field), list) else data.get(field, '')
+                             for field in (csv_api_fields[column] for column in columns)])
+
+
+def bench_csv(app, services, directory, rows):
+    import batch
+
+    path = os.path.join(directory, 'MetObjects.csv')
+    write_csv(services, path, rows)
+    # Sweep the fake SPARQL endpoint first, like a real offline run would have
+    services.sweep_ids = range(1, rows + 1)
+    app.met_index.sweep(page_size=10000, pause=0)
+
+    def run():
+        processed, failed = batch.run_csv(path, os.path.join(directory, 'csv-run'), app.crosswalk_cache.get_lookup(),
+                                          app.met_index, app.reconciler,
+                                          fetch_claims=app.fetch_claims)
+        return {'objects': processed, 'failed': failed}
+
+    return measure(run)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=__dir__, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(args):
+    latency = dict(default_latency)
+    for setting in args.latency:
+        service, seconds = setting.split('=')
+        latency[service] = float(seconds)
+
+    import app
+
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'latency': latency,
+               'scenarios': {}}
+    with FakeServices(latency=latency) as services, tempfile.TemporaryDirectory() as directory, \
+            mock.patch.multiple(app, **services.app_overrides(directory)):
+        scenarios = results['scenarios']
+        ids = range(1, args.requests + 1)
+        scenarios['metid_cold'] = measure(lambda: bench_metid(app, ids))
+        scenarios['metid_warm'] = measure(lambda: bench_metid(app, ids))
+
+        batch_ids = range(100000, 100000 + args.batch)
+        batch_result = measure(lambda: bench_batch(app, batch_ids, os.path.join(directory, 'batch'), args.workers))
+        batch_result['objects_per_second'] = batch_result['objects'] / batch_result['seconds']
+        scenarios['batch'] = batch_result
+
+        if args.csv_rows:
+            csv_result = bench_csv(app, services, directory, args.csv_rows)
+            csv_result['objects_per_second'] = csv_result['objects'] / csv_result['seconds']
+            scenarios['batch_csv'] = csv_result
+
+        results['requests'] = services.requests
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def report(results, previous=None):
+    print('commit {}  python {}  latency {}'.format(results['commit'], results['python'], results['latency']))
+    for name, scenario in results['scenarios'].items():
+        parts = []
+        for key, value in scenario.items():
+            text = '{}={:.1f}'.format(key, value) if isinstance(value, float) else '{}={}'.format(key, value)
+            old = (previous or {}).get('scenarios', {}).get(name, {}).get(key)
+            if isinstance(value, float) and old:
+                text += ' ({:+.0%})'.format(value / old - 1)
+            parts.append(text)
+        print('{:<12} {}'.format(name, '  '.join(parts)))
+    print('service requests {}  max RSS {:.0f} MB'.format(results['requests'], results['max_rss_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark /metid and the batch modes against fake services')
+    parser.add_argument('--requests', type=int, default=50, help='objects to view in the /metid scenarios')
+    parser.add_argument('--batch', type=int, default=200, help='objects in the batch scenario')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--csv-rows', type=int, default=5000, help='rows of the generated CSV dump, 0 to skip')
+    parser.add_argument('--latency', action='append', default=[], metavar='SERVICE=SECONDS',
+                        help='delay of a fake service: met, sparql, wiki or recon')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    results = run_all(args)
+    report(results, previous)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
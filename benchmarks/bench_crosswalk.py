@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Crosswalk parse cost against table size: the line-based parser, the mwparserfromhell/wikitables
+# parser it falls back to for tables with templates or HTML, and writing/loading the pickled
+# snapshot a restarted worker starts from. Tables are generated in the shape of the crosswalk page.
+#
+#   python benchmarks/bench_crosswalk.py
+#   python benchmarks/bench_crosswalk.py --rows 1000 10000 100000 --full-max 10000
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(__dir__, '..'))
+
+import crosswalk  # noqa: E402
+from bench_app import git_commit  # noqa: E402
+
+
+def generate_wikitext(rows):
+    lines = ['{| class="wikitable sortable"', '! Object Name !! QID !! extrastatement !! extraqualifier']
+    for i in range(rows):
+        extra = 'Q860861' if i % 7 == 0 else ''
+        lines += ['|-', '| Object name {} || Q{} || {} || '.format(i, 1000 + i, extra)]
+    lines.append('|}')
+    return '\n'.join(lines) + '\n'
+
+
+# Best of repeat runs of func, in milliseconds
+def best_ms(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return 1000 * best
+
+
+def bench_size(rows, full, repeat, directory):
+    wikitext = generate_wikitext(rows)
+    result = {'rows': rows, 'wikitext_kb': len(wikitext.encode('utf-8')) / 1024,
+              'line_parser_ms': best_ms(lambda: crosswalk._parse_simple_table(wikitext), repeat)}
+    if full:
+        result['wikitables_ms'] = best_ms(lambda: crosswalk._parse_full_table(wikitext, 'bench'), 1)
+
+    cache = crosswalk.CrosswalkCache('unused', 'bench', snapshot_path=os.path.join(directory, 'crosswalk.pickle'))
+    cache.table, cache.revid = crosswalk.parse_crosswalk(wikitext), 1
+    result['snapshot_write_ms'] = best_ms(cache._save_snapshot, repeat)
+    result['snapshot_kb'] = os.path.getsize(cache.snapshot_path) / 1024
+
+    def load():
+        warm = crosswalk.CrosswalkCache('unused', 'bench', snapshot_path=cache.snapshot_path)
+        warm._load_snapshot()
+        assert len(warm.lookup) == rows
+
+    result['snapshot_load_ms'] = best_ms(load, repeat)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark crosswalk parsing and snapshot loading by table size')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--full-max', type=int, default=10000,
+                        help='largest table to also parse with mwparserfromhell/wikitables, which is slow')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [bench_size(rows, rows <= args.full_max, args.repeat, directory) for rows in args.rows]
+
+    print('commit {}'.format(git_commit()))
+    columns = ['rows', 'wikitext_kb', 'line_parser_ms', 'wikitables_ms', 'snapshot_kb', 'snapshot_write_ms',
+               'snapshot_load_ms']
+    print('  '.join('{:>17}'.format(column) for column in columns))
+    for result in results:
+        print('  '.join('{:>17}'.format('{:.1f}'.format(result[column]) if isinstance(result.get(column), float)
+                                        else str(result.get(column, '-'))) for column in columns))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': git_commit(), 'results': results}, f, indent=2)
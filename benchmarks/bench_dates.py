@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Throughput of the objectDate parser, per string and over a pandas column.
+#
+#   python benchmarks/bench_dates.py                      # built-in sample of Met date strings
+#   python benchmarks/bench_dates.py --csv MetObjects.csv # every objectDate in the Open Access dump
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd  # noqa: E402
+
+from dates import parse_dates, parse_object_date  # noqa: E402
+
+# A spread of real objectDate values from the Met collection, roughly in proportion to how often
+# each style shows up in the dump
+sample_dates = [
+    '1889', '1889', '1889', '1750', '1920', 'ca. 1882', 'ca. 1882–89', '1882–1901', '1850–60',
+    'ca. 1390–1352 B.C.', 'ca. 1390–52 B.C.', '664–332 B.C.', '30 B.C.–A.D. 364', 'A.D. 100',
+    '1880s', 'early 1880s', '19th century', 'late 19th century', 'mid-19th century',
+    'first half of the 18th century', '3rd century B.C.', '19th–20th century', '12th–11th century B.C.',
+    'before 1900', 'after 1750', 'Dynasty 18', 'Dynasty 12, reign of Senwosret I', 'Ptolemaic Period',
+    'ca. 2000 B.C.', '1st century A.D.', '1615?', 'n.d.', 'late 2nd–early 1st century B.C.', '',
+]
+
+
+def report(label, count, elapsed):
+    print('{:<28} {:>9} strings {:>8.3f}s {:>12,.0f}/s'.format(label, count, elapsed, count / elapsed))
+
+
+def bench(values):
+    values = list(values)
+
+    # Without the memo cache, i.e. the cost of actually matching every string
+    parse = parse_object_date.__wrapped__
+    start = time.perf_counter()
+    for value in values:
+        parse(value)
+    report('parse_object_date uncached', len(values), time.perf_counter() - start)
+
+    parse_object_date.cache_clear()
+    start = time.perf_counter()
+    for value in values:
+        parse_object_date(value)
+    report('parse_object_date', len(values), time.perf_counter() - start)
+
+    parse_object_date.cache_clear()
+    series = pd.Series(values)
+    start = time.perf_counter()
+    parsed = parse_dates(series)
+    report('parse_dates', len(values), time.perf_counter() - start)
+
+    kinds = collections.Counter(parsed['kind'].fillna('unparsed'))
+    print('distinct strings: {}'.format(series.nunique()))
+    for kind, count in kinds.most_common():
+        print('  {:<16} {:>9} {:>6.1%}'.format(kind, count, count / len(values)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Met objectDate parser')
+    parser.add_argument('--csv', help='path to the MetObjects.csv Open Access dump')
+    parser.add_argument('--repeat', type=int, default=10000, help='copies of the built-in sample to parse')
+    args = parser.parse_args()
+    if args.csv:
+        dates = pd.read_csv(args.csv, usecols=['Object Date'], dtype=str, keep_default_na=False)['Object Date']
+    else:
+        dates = sample_dates * args.repeat
+    bench(dates)
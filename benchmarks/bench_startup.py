@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Cold start benchmark: how long a fresh worker process takes to import the app and to answer its
+# first requests, and which heavy libraries it has loaded by then. Each run is a new interpreter,
+# with the crosswalk snapshot already on disk as it is on a restarted webservice. The remote
+# services are the local fakes with no delay, so only local work is measured.
+#
+#   python benchmarks/bench_startup.py                        # median of 5 runs
+#   python benchmarks/bench_startup.py --json before.json     # save results
+#   python benchmarks/bench_startup.py --compare before.json  # ... and diff a later run against them
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(__dir__, '..'))
+
+from bench_app import git_commit  # noqa: E402
+from fakeservices import FakeServices  # noqa: E402
+
+# Modules that should only be loaded once the crosswalk has to be parsed
+heavy_modules = ['pandas', 'numpy', 'mwparserfromhell', 'wikitables']
+
+# Run in a fresh interpreter: argv[1] is a scratch directory holding the crosswalk snapshot
+child = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+heavy = {heavy!r}
+after_import = [m for m in heavy if m in sys.modules]
+
+import os
+from unittest import mock
+from crosswalk import CrosswalkCache, objectname_crosswalk_page
+from fakeservices import FakeServices
+
+with FakeServices(latency={{'met': 0, 'sparql': 0, 'wiki': 0, 'recon': 0}}) as services:
+    overrides = services.app_overrides(sys.argv[1])
+    overrides['crosswalk_cache'] = CrosswalkCache(services.wiki_api_url, objectname_crosswalk_page,
+                                                  snapshot_path=os.path.join(sys.argv[1], 'crosswalk.pickle'))
+    with mock.patch.multiple(app, **overrides), mock.patch.dict(app.app.config, PREFETCH_AHEAD=0):
+        client = app.app.test_client()
+        t = time.perf_counter()
+        client.get('/')
+        index = time.perf_counter() - t
+        t = time.perf_counter()
+        client.get('/metid/1')
+        metid = time.perf_counter() - t
+
+print(json.dumps({{'import_ms': 1000 * (imported - start), 'first_index_ms': 1000 * index,
+                  'first_metid_ms': 1000 * metid, 'heavy_after_import': after_import,
+                  'heavy_after_metid': [m for m in heavy if m in sys.modules]}}))
+'''.format(heavy=heavy_modules)
+
+
+# Write the crosswalk snapshot a restarted worker would find
+def write_snapshot(directory):
+    from crosswalk import CrosswalkCache, objectname_crosswalk_page
+
+    with FakeServices(latency={'wiki': 0}) as services:
+        CrosswalkCache(services.wiki_api_url, objectname_crosswalk_page,
+                       snapshot_path=os.path.join(directory, 'crosswalk.pickle')).get_lookup()
+
+
+def run_once(directory):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(__dir__, '..'), __dir__]))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', child, directory], cwd=os.path.join(__dir__, '..'), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    result['process_ms'] = 1000 * (time.perf_counter() - start)
+    return result
+
+
+def run_all(runs):
+    with tempfile.TemporaryDirectory() as directory:
+        write_snapshot(directory)
+        results = [run_once(directory) for _ in range(runs)]
+    summary = {key: statistics.median(result[key] for result in results)
+               for key in ('import_ms', 'first_index_ms', 'first_metid_ms', 'process_ms')}
+    summary.update({'heavy_after_import': results[-1]['heavy_after_import'],
+                    'heavy_after_metid': results[-1]['heavy_after_metid']})
+    return {'commit': git_commit(), 'python': '{}.{}.{}'.format(*sys.version_info[:3]), 'runs': runs,
+            'startup': summary}
+
+
+def report(results, previous=None):
+    print('commit {}  python {}  median of {} runs'.format(results['commit'], results['python'], results['runs']))
+    old = (previous or {}).get('startup', {})
+    for key, value in results['startup'].items():
+        text = '{:.1f}'.format(value) if isinstance(value, float) else ', '.join(value) or '-'
+        if isinstance(value, float) and old.get(key):
+            text += ' ({:+.0%})'.format(value / old[key] - 1)
+        print('{:<20} {}'.format(key, text))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark app import and first responses in fresh processes')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    results = run_all(args.runs)
+    report(results, previous)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Local stand-ins for the Met collection API, the Wikidata SPARQL endpoint, the Wikidata MediaWiki
+# API (crosswalk page and wbgetentities) and the reconciliation service, replaying the recorded
+# responses in fixtures/ with a configurable delay per service. Used by the benchmarks and tests,
+# so the app can be measured end to end without touching the real services.
+#
+# Object IDs decide what the fake services answer: IDs divisible by 10 are "not in use" at the
+# Met, and every existing_every-th ID already has a Wikidata item.
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Delay in seconds before each service answers, roughly the median latency of the real ones
+default_latency = {'met': 0.03, 'sparql': 0.15, 'wiki': 0.05, 'recon': 0.08}
+
+# Variations applied to the recorded Met object by ID, so objects exercise different code paths
+object_names = ['Painting', 'Bust', 'Vase', 'Print', 'Drawing', 'Photograph', 'Figure', 'Bowl', 'Mystery object']
+object_dates = ['1889', 'ca. 1882', 'ca. 1882–89', '19th century', 'late 18th century', '1880s',
+                'ca. 1390–1352 B.C.', 'Dynasty 18', 'n.d.']
+artists = ['Vincent van Gogh', 'Claude Monet', 'Unknown', '']
+departments = ['European Paintings', 'Drawings and Prints', 'Egyptian Art', 'Asian Art', 'The American Wing']
+
+entity_prefix = 'http://www.wikidata.org/entity/'
+
+
+def load_fixture(name):
+    with open(os.path.join(fixtures_dir, name), encoding='utf-8') as f:
+        return f.read() if name.endswith('.wikitext') else json.load(f)
+
+
+def existing_qid(metid):
+    return 'Q{}'.format(90000000 + int(metid))
+
+
+class FakeServices:
+    # sweep_ids are the Met IDs a full sweep of the SPARQL endpoint pages through
+    def __init__(self, latency=None, existing_every=3, crosswalk_revid=1, sweep_ids=()):
+        self.latency = dict(default_latency, **(latency or {}))
+        self.existing_every = existing_every
+        self.sweep_ids = sweep_ids
+        self.crosswalk_revid = crosswalk_revid
+        self.item_revid = 1  # lastrevid of every item, bumped to stand for an edit
+        self.met_object = load_fixture('met_object.json')
+        self.crosswalk_wikitext = load_fixture('crosswalk.wikitext')
+        self.recon_results = load_fixture('recon.json')
+        self.requests = {service: 0 for service in self.latency}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    @property
+    def met_api_base(self):
+        return self.base_url + '/met/objects/'
+
+    @property
+    def sparql_url(self):
+        return self.base_url + '/sparql'
+
+    @property
+    def wiki_api_url(self):
+        return self.base_url + '/w/api.php'
+
+    @property
+    def recon_url(self):
+        return self.base_url + '/recon'
+
+    def _count(self, service):
+        with self._lock:
+            self.requests[service] += 1
+        if self.latency.get(service):
+            time.sleep(self.latency[service])
+
+    def has_item(self, metid):
+        return int(metid) % self.existing_every == 0
+
+    def met_object_for(self, id):
+        if id % 10 == 0:
+            return 404, {'message': 'ObjectID not found'}
+        data = copy.deepcopy(self.met_object)
+        data.update({'objectID': id,
+                     'accessionNumber': '1993.{}'.format(id),
+                     'objectName': object_names[id % len(object_names)],
+                     'objectDate': object_dates[id % len(object_dates)],
+                     'artistDisplayName': artists[id % len(artists)],
+                     'department': departments[id % len(departments)],
+                     'isPublicDomain': id % 4 != 1,
+                     'objectURL': 'https://www.metmuseum.org/art/collection/search/{}'.format(id),
+                     'objectWikidata_URL': 'https://www.wikidata.org/wiki/{}'.format(existing_qid(id))
+                     if self.has_item(id) else ''})
+        return 200, data
+
+    def sparql_bindings(self, query):
+        metids = re.findall(r'"(\d+)"', query)
+        paging = re.search(r'LIMIT (\d+) OFFSET (\d+)', query)
+        if not metids and paging:
+            items = [metid for metid in self.sweep_ids if self.has_item(metid)]
+            limit, offset = int(paging.group(1)), int(paging.group(2))
+            metids = [str(metid) for metid in items[offset:offset + limit]]
+        bindings = []
+        for metid in metids:
+            if self.has_item(metid):
+                bindings.append({'item': {'type': 'uri', 'value': entity_prefix + existing_qid(metid)},
+                                 'metid': {'type': 'literal', 'value': metid},
+                                 'instance': {'type': 'uri', 'value': entity_prefix + 'Q3305213'},
+                                 'inventory': {'type': 'literal', 'value': '1993.{}'.format(metid)}})
+        return {'head': {'vars': ['item', 'metid', 'instance', 'inventory']}, 'results': {'bindings': bindings}}
+
+    def wiki_response(self, params):
+        if params.get('action') == 'wbgetentities':
+            entities = {}
+            for qid in params['ids'].split('|'):
+                metid = str(int(qid[1:]) - 90000000)
+                entities[qid] = {'id': qid, 'lastrevid': self.item_revid,
+                                 'labels': {'en': {'language': 'en', 'value': 'Object {}'.format(metid)}},
+                                 'claims': {'P31': [{'mainsnak': {'snaktype': 'value', 'property': 'P31', 'datavalue': {
+                                     'type': 'wikibase-entityid', 'value': {'id': 'Q3305213'}}}}]}}
+            return {'entities': entities}
+        revision = {'revid': self.crosswalk_revid}
+        if 'content' in params.get('rvprop', ''):
+            revision['*'] = self.crosswalk_wikitext
+        return {'query': {'pages': {'1': {'title': params.get('titles'), 'revisions': [revision]}}}}
+
+    def recon_response(self, form):
+        queries = json.loads(form['queries'])
+        return {key: {'result': self.recon_results.get(q['query'], [])} for key, q in queries.items()}
+
+    # Attributes of the app module to patch (e.g. with mock.patch.multiple) so it uses these services,
+    # with its caches and index kept under directory
+    def app_overrides(self, directory):
+        import functools
+
+        import claims
+        from crosswalk import CrosswalkCache, objectname_crosswalk_page
+        from metcache import MetCache
+        from metindex import MetIndex
+        from pagecache import PageCache, RevisionCache
+        from recon import ReconCache, Reconciler
+
+        return {'sparql_api_url': self.sparql_url,
+                'met_cache': MetCache(os.path.join(directory, 'metcache.sqlite3'), api_base=self.met_api_base),
+                'met_index': MetIndex(os.path.join(directory, 'metindex.sqlite3'), sparql_url=self.sparql_url),
+                'crosswalk_cache': CrosswalkCache(self.wiki_api_url, objectname_crosswalk_page),
+                'reconciler': Reconciler(ReconCache(os.path.join(directory, 'recon.sqlite3')),
+                                         api_url=self.recon_url),
+                'fetch_claims': functools.partial(claims.fetch_claims, api_url=self.wiki_api_url),
+                'fetch_lastrevids': functools.partial(claims.fetch_lastrevids, api_url=self.wiki_api_url),
+                'page_cache': PageCache(),
+                'item_revisions': RevisionCache(functools.partial(claims.fetch_lastrevids, api_url=self.wiki_api_url))}
+
+
+def _handler(services):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body):
+            body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _form(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return dict(urllib.parse.parse_qsl(self.rfile.read(length).decode('utf-8')))
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            if url.path.startswith('/met/objects/'):
+                services._count('met')
+                self._send(*services.met_object_for(int(url.path.rsplit('/', 1)[1])))
+            elif url.path == '/w/api.php':
+                services._count('wiki')
+                self._send(200, services.wiki_response(params))
+            else:
+                self._send(404, {'error': 'unknown path'})
+
+        def do_POST(self):
+            form = self._form()
+            if self.path == '/sparql':
+                services._count('sparql')
+                self._send(200, services.sparql_bindings(form['query']))
+            elif self.path == '/recon':
+                services._count('recon')
+                self._send(200, services.recon_response(form))
+            else:
+                self._send(404, {'error': 'unknown path'})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Current claims of existing Wikidata items, so only statements and qualifiers that are missing
+# get emitted for them. Claims come from wbgetentities (50 items per call, with qualifiers, labels
+# and descriptions), or from the Met ID index / SPARQL bindings, which know the values of the
+# indexed properties but not their qualifiers.
+#
+# Claims are {property: {value: qualifiers}}, with values in bare QuickStatements syntax (no
+# quotes around strings) and qualifiers a set of (property, value) pairs, or None if unknown.
+# Labels and descriptions are under 'Len' and 'Den', like the statements that set them.
+
+import re
+
+import httpclient
+from crosswalk import wikidata_api_url
+
+# wbgetentities accepts at most 50 IDs per call
+entities_batch_size = 50
+
+_time_re = re.compile(r'^([+-]\d+)-')
+
+
+# Plain value of a snak in QuickStatements syntax, or None for datatypes we never emit
+def snak_value(snak):
+    if snak['snaktype'] != 'value':
+        return snak['snaktype']  # somevalue / novalue
+    datavalue = snak['datavalue']
+    value = datavalue['value']
+    if datavalue['type'] == 'wikibase-entityid':
+        return value['id']
+    if datavalue['type'] == 'string':
+        return value
+    if datavalue['type'] == 'time':
+        # Only year-or-coarser precision is emitted, which Quickstatements writes with zero month and day
+        matched = _time_re.match(value['time'])
+        if value['precision'] <= 9 and matched:
+            return '{}-00-00T00:00:00Z/{}'.format(matched.group(1), value['precision'])
+        return '{}/{}'.format(value['time'], value['precision'])
+    return None
+
+
+def claims_from_entity(entity):
+    claims = {}
+    for prop, statements in entity.get('claims', {}).items():
+        values = claims.setdefault(prop, {})
+        for st in statements:
+            value = snak_value(st['mainsnak'])
+            if value is None:
+                continue
+            qualifiers = values.setdefault(value, set())
+            for qualifier_prop, snaks in st.get('qualifiers', {}).items():
+                qualifiers.update((qualifier_prop, snak_value(snak)) for snak in snaks)
+    if 'en' in entity.get('labels', {}):
+        claims['Len'] = {entity['labels']['en']['value']: set()}
+    if 'en' in entity.get('descriptions', {}):
+        claims['Den'] = {entity['descriptions']['en']['value']: set()}
+    return claims
+
+
+# {property: [values]} of a Met ID index match, whose qualifiers are not known
+def claims_from_index(properties):
+    return {prop: {value: None for value in values} for prop, values in properties.items()}
+
+
+# Returns {qid: claims} for the given items, in batches of 50 per wbgetentities call
+def fetch_claims(qids, api_url=wikidata_api_url, batch_size=entities_batch_size):
+    qids = sorted(set(qids))
+    found = {}
+    for start in range(0, len(qids), batch_size):
+        r = httpclient.get(api_url, params={'action': 'wbgetentities',
+                                            'ids': '|'.join(qids[start:start + batch_size]),
+                                            'props': 'claims|labels|descriptions',
+                                            'languages': 'en',
+                                            'format': 'json',
+                                            'maxlag': 5})
+        r.raise_for_status()
+        for qid, entity in r.json().get('entities', {}).items():
+            if 'missing' not in entity:
+                found[qid] = claims_from_entity(entity)
+    return found
+
+
+# Returns {qid: lastrevid} for the given items: a cheap way to tell whether an item was edited
+# since its claims were last fetched
+def fetch_lastrevids(qids, api_url=wikidata_api_url, batch_size=entities_batch_size):
+    qids = sorted(set(qids))
+    found = {}
+    for start in range(0, len(qids), batch_size):
+        r = httpclient.get(api_url, params={'action': 'wbgetentities',
+                                            'ids': '|'.join(qids[start:start + batch_size]),
+                                            'props': 'info',
+                                            'format': 'json',
+                                            'maxlag': 5})
+        r.raise_for_status()
+        for qid, entity in r.json().get('entities', {}).items():
+            if 'missing' not in entity:
+                found[qid] = entity.get('lastrevid')
+    return found
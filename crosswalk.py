@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+
+# Process-wide cache of the objectName crosswalk, which lives as a wikitable on a Wikidata page.
+# The table is only re-downloaded and re-parsed when the page revision changes, and the parsed
+# table is snapshotted to disk so a restarted worker does not have to fetch it again.
+#
+# Plain tables are read by a line-based parser; mwparserfromhell/wikitables are only imported for
+# tables with markup it does not handle, and pandas only when the DataFrame is asked for, so a
+# worker starting from a snapshot never loads them.
+
+import collections
+import os
+import pickle
+import re
+import threading
+import time
+
+import requests
+
+import httpclient
+import metrics
+
+# OLD page for dashboard/crosswalk
+# objectname_crosswalk_page = 'User:Fuzheado/Met/glamingest/objectName'
+objectname_crosswalk_page = 'Wikidata:GLAM/Metropolitan_Museum_of_Art/glamingest/objectName'
+wikidata_api_url = 'https://www.wikidata.org/w/api.php'
+
+# Format of the pickled snapshot: a dict with this version, the revid and title of the page, and the
+# parsed table. Snapshots of another version are ignored and rebuilt.
+snapshot_version = 1
+
+
+class ArticleNotFound(Exception):
+    pass
+
+
+def fetch_page(api_url, title, rvprop='ids|content'):
+    params = {'prop': 'revisions',
+              'format': 'json',
+              'action': 'query',
+              'explaintext': '',
+              'titles': title,
+              'rvprop': rvprop,
+              'maxlag': 5}
+
+    r = httpclient.get(api_url, params=params)
+    r.raise_for_status()
+    pages = r.json()["query"]["pages"]
+
+    # use key from first result in 'pages' array
+    pageid = list(pages.keys())[0]
+    if pageid == '-1':
+        raise ArticleNotFound('no matching articles returned')
+
+    return pages[pageid]
+
+
+# Cheap check of the latest revision ID of a page, without downloading its content
+def fetch_revid(api_url, title):
+    page = fetch_page(api_url, title, rvprop='ids')
+    return page['revisions'][0]['revid']
+
+
+# Where the crosswalk page is read from: the MediaWiki API over the shared HTTP client, or
+# pywikibot (ApiSource and PywikibotSource). Both give the page as (wikitext, revid, title).
+class ApiSource:
+    def __init__(self, api_url=wikidata_api_url):
+        self.api_url = api_url
+
+    def revid(self, title):
+        return fetch_revid(self.api_url, title)
+
+    def page(self, title):
+        page = fetch_page(self.api_url, title)
+        return page['revisions'][0]['*'], page['revisions'][0]['revid'], page['title']
+
+
+class PywikibotSource:
+    # site defaults to Wikidata, configured through pywikibot's user-config.py
+    def __init__(self, site=None):
+        self.site = site
+
+    def _page(self, title):
+        import pywikibot
+
+        if self.site is None:
+            self.site = pywikibot.Site('wikidata', 'wikidata')
+        return pywikibot.Page(self.site, title)
+
+    def revid(self, title):
+        return self._page(title).latest_revision_id
+
+    def page(self, title):
+        page = self._page(title)
+        return page.text, page.latest_revision_id, page.title()
+
+
+# Import the parsing libraries up front, e.g. before forking workers that will share them
+def load_parsers():
+    import mwparserfromhell  # noqa: F401
+    import pandas  # noqa: F401
+    import wikitables  # noqa: F401
+
+
+def import_tables_from_wikitext(wikitext, title='generic'):
+    import mwparserfromhell as mwp
+    from wikitables import WikiTable
+    from wikitables.util import ftag
+
+    # parse for tables
+    raw_tables = mwp.parse(wikitext).filter_tags(matches=ftag('table'))
+
+    def _table_gen():
+        for idx, table in enumerate(raw_tables):
+            name = '%s[%s]' % (title, idx)
+            yield WikiTable(name, table)
+
+    return list(_table_gen())
+
+
+# The parsed crosswalk is a table in the pandas 'split' layout, {'columns': [...], 'data': [[...], ...]},
+# with cells as stripped strings and blank cells as None
+
+# Markup the line-based parser does not handle, so the table goes through mwparserfromhell instead
+_complex_markup = re.compile(r'\{\{|\{\||<|rowspan|colspan|\[\[[^\]]*\[\[')
+_wikilink_re = re.compile(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]')
+_emphasis_re = re.compile(r"'{2,}")
+
+
+class _ComplexTable(Exception):
+    pass
+
+
+def _split_cells(line, separator):
+    if '[[' not in line:
+        return line.split(separator)
+    # Separators inside wikilinks ([[target|label]]) do not split cells
+    cells, depth, start, i = [], 0, 0, 0
+    while i < len(line):
+        if line.startswith('[[', i):
+            depth += 1
+            i += 2
+        elif line.startswith(']]', i):
+            depth = max(depth - 1, 0)
+            i += 2
+        elif depth == 0 and line.startswith(separator, i):
+            cells.append(line[start:i])
+            i += len(separator)
+            start = i
+        else:
+            i += 1
+    cells.append(line[start:])
+    return cells
+
+
+def _cell_text(cell):
+    if '|' not in cell and '[' not in cell and "''" not in cell:
+        return cell.strip() or None
+    # Drop cell attributes (style="..." | value)
+    parts = _split_cells(cell, '|')
+    if len(parts) > 2 or (len(parts) == 2 and '=' not in parts[0]):
+        raise _ComplexTable(cell)
+    text = _emphasis_re.sub('', _wikilink_re.sub(r'\1', parts[-1])).strip()
+    return text or None
+
+
+# Fast path for a plain wikitable: one header row, one line or '||'-separated cells per row, and no
+# templates, HTML or spanning cells. Raises _ComplexTable for anything else.
+def _parse_simple_table(wikitext):
+    lines = iter(wikitext.splitlines())
+    for line in lines:
+        if line.lstrip().startswith('{|'):
+            break
+    else:
+        raise _ComplexTable('no table')
+
+    header, rows, row = None, [], None
+    header_closed = False
+    for line in lines:
+        line = line.strip()
+        if line.startswith('|}'):
+            break
+        if _complex_markup.search(line):
+            raise _ComplexTable(line)
+        if not line or line.startswith('|+'):
+            continue
+        if line.startswith('|-'):
+            row = None
+            header_closed = header is not None
+        elif line.startswith('!'):
+            # Header cells may be on one line or several, but only one header row is handled
+            if header_closed or rows:
+                raise _ComplexTable(line)
+            header = (header or []) + [(_cell_text(cell) or '')
+                                       for cell in _split_cells(line[1:].replace('||', '!!'), '!!')]
+        elif line.startswith('|'):
+            if row is None:
+                row = []
+                rows.append(row)
+            row.extend(_cell_text(cell) for cell in _split_cells(line[1:], '||'))
+        else:
+            # Continuation of the last cell over several lines
+            raise _ComplexTable(line)
+    else:
+        raise _ComplexTable('unterminated table')
+
+    if header is None or any(len(row) != len(header) for row in rows):
+        raise _ComplexTable('rows do not match the header')
+    return {'columns': header, 'data': [row for row in rows if any(cell is not None for cell in row)]}
+
+
+def _parse_full_table(wikitext, title):
+    tables = import_tables_from_wikitext(wikitext, title)
+    if not tables:
+        raise ValueError('no table on {}'.format(title))
+    columns = list(tables[0].head)
+    return {'columns': columns,
+            'data': [[(str(row[c].value).strip() or None) if c in row else None for c in columns]
+                     for row in tables[0].rows]}
+
+
+# First table of a crosswalk page, through the line-based parser when it is a plain table and
+# through mwparserfromhell/wikitables otherwise
+def parse_crosswalk(wikitext, title='generic'):
+    try:
+        return _parse_simple_table(wikitext)
+    except _ComplexTable:
+        return _parse_full_table(wikitext, title)
+
+
+# The crosswalk page from source (an ApiSource or PywikibotSource), as (table, revid)
+def load_crosswalk(source, title=objectname_crosswalk_page):
+    wikitext, revid, title = source.page(title)
+    return parse_crosswalk(wikitext, title), revid
+
+
+def crosswalk_dataframe(table):
+    import pandas as pd
+
+    return pd.DataFrame(table['data'], columns=table['columns'])
+
+
+CrosswalkEntry = collections.namedtuple('CrosswalkEntry', ['qid', 'extrastatement', 'extraqualifier'])
+
+
+# Case-folded, whitespace-collapsed key used when an objectName has no exact match
+def normalize_name(name):
+    return ' '.join(name.split()).casefold()
+
+
+def _cell(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+# Dict-backed objectName -> crosswalk entry index, so resolving a name is a hash lookup rather than
+# a scan of the DataFrame. Once built it has no pandas dependency and can be shared by batch jobs.
+class CrosswalkLookup:
+    def __init__(self, rows=()):
+        self.exact = {}
+        self.normalized = {}
+        for name, qid, extrastatement, extraqualifier in rows:
+            if not isinstance(name, str) or not name.strip():
+                continue
+            entry = CrosswalkEntry(_cell(qid), _cell(extrastatement), _cell(extraqualifier))
+            # First row wins, as it did with the old regex scan
+            self.exact.setdefault(name, entry)
+            self.normalized.setdefault(normalize_name(name), entry)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        columns = [df[c] if c in df else [None] * len(df)
+                   for c in ('Object Name', 'QID', 'extrastatement', 'extraqualifier')]
+        return cls(zip(*columns))
+
+    # From a table in the pandas 'split' layout ({'columns': [...], 'data': [[...], ...]}), without pandas
+    @classmethod
+    def from_table(cls, table):
+        positions = [table['columns'].index(c) if c in table['columns'] else None
+                     for c in ('Object Name', 'QID', 'extrastatement', 'extraqualifier')]
+        return cls([row[i] if i is not None else None for i in positions] for row in table['data'])
+
+    def __len__(self):
+        return len(self.exact)
+
+    # Returns (entry, exact) where exact is False if only the normalized key matched
+    def resolve(self, name):
+        if not isinstance(name, str):
+            return None, False
+        entry = self.exact.get(name)
+        if entry is not None:
+            return entry, True
+        return self.normalized.get(normalize_name(name)), False
+
+    def get(self, name):
+        return self.resolve(name)[0]
+
+    # Resolve many objectNames at once, only doing the work once per distinct name
+    def resolve_many(self, names):
+        return {name: self.get(name) for name in set(names)}
+
+
+class CrosswalkCache:
+    # source is an ApiSource or PywikibotSource, or the URL of a MediaWiki API. ttl is how many
+    # seconds a loaded table is trusted before the (cheap) revid check is repeated.
+    def __init__(self, source, title, snapshot_path=None, ttl=300):
+        self.source = ApiSource(source) if isinstance(source, str) else source
+        self.title = title
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.table = None  # parsed table in the pandas 'split' layout, see CrosswalkLookup.from_table
+        self.df = None  # DataFrame of the table, only built when asked for
+        self.lookup = CrosswalkLookup()
+        self.revid = None
+        self.checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            self._ensure_fresh()
+            if self.df is None:
+                self.df = crosswalk_dataframe(self.table)
+            return self.df
+
+    def get_lookup(self):
+        with self._lock:
+            self._ensure_fresh()
+            return self.lookup
+
+    # Revision of the wiki page the current table was parsed from
+    def get_revid(self):
+        with self._lock:
+            self._ensure_fresh()
+            return self.revid
+
+    # Same, without checking the wiki (None if no table is loaded yet). It is checked again as soon
+    # as the table is next used after ttl.
+    def peek_revid(self):
+        with self._lock:
+            return self.revid if self.table is not None else None
+
+    def _ensure_fresh(self):
+        if self.table is None:
+            self._load_snapshot()
+        if self.table is None or time.time() - self.checked >= self.ttl:
+            self._revalidate()
+
+    # Force a rebuild, e.g. right after editors have updated the table on-wiki
+    def refresh(self):
+        with self._lock:
+            self._rebuild()
+            return self.revid
+
+    def _revalidate(self):
+        try:
+            revid = self.source.revid(self.title)
+        except requests.RequestException:
+            # Keep serving the table we already have if the wiki is unreachable
+            if self.table is None:
+                raise
+            self.checked = time.time()
+            return
+        if revid != self.revid:
+            metrics.cache('crosswalk', 'changed')
+            self._rebuild()
+        else:
+            metrics.cache('crosswalk', 'unchanged')
+            self.checked = time.time()
+
+    def _rebuild(self):
+        with metrics.timed('crosswalk_fetch'):
+            wikitext, revid, title = self.source.page(self.title)
+        with metrics.timed('crosswalk_parse'):
+            self.table = parse_crosswalk(wikitext, title)
+            self.df = None
+            self.lookup = CrosswalkLookup.from_table(self.table)
+        self.revid = revid
+        self.checked = time.time()
+        self._save_snapshot()
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot.get('version') != snapshot_version:
+                return
+            table = snapshot['table']
+            lookup = CrosswalkLookup.from_table(table)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError, KeyError, TypeError):
+            return
+        self.table = table
+        self.df = None
+        self.lookup = lookup
+        self.revid = snapshot['revid']
+        # Trust the snapshot for the rest of its TTL, counted from when it was written
+        self.checked = os.path.getmtime(self.snapshot_path)
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temp file first so another worker never reads a half-written snapshot
+        tmp_path = '{}.{}.tmp'.format(self.snapshot_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': snapshot_version, 'revid': self.revid, 'title': self.title, 'table': self.table},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_path)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Crosswalk coverage report: which Met objectNames have no Wikidata class in the crosswalk, ranked
+# by how many objects in the Open Access dump use them. The dump is counted by objectName and
+# classification in one grouped pass and joined against the crosswalk, and the gaps are written as
+# a wikitable for the crosswalk talk page, so editors fill in the entries that matter most first.
+#
+#   python crosswalk_report.py MetObjects.csv                        # top 100 gaps to stdout
+#   python crosswalk_report.py MetObjects.csv --limit 500 --out gaps.wikitext
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Classifications listed per objectName in the report
+top_classifications = 3
+
+
+# Object counts per (Object Name, Classification) in the Met Open Access CSV dump
+def read_counts(path):
+    df = pd.read_csv(path, usecols=['Object Name', 'Classification'], dtype='category', keep_default_na=False,
+                     encoding='utf-8-sig')
+    counts = df.groupby(['Object Name', 'Classification'], observed=True).size().rename('objects').reset_index()
+    return counts[counts['objects'] > 0].astype({'Object Name': str, 'Classification': str})
+
+
+# One row per objectName with its object count, share of all objects and crosswalk status: mapped,
+# 'no QID' (listed without a class) or missing. Names are matched like CrosswalkLookup.resolve, exact
+# first and then case and whitespace insensitively. Ranked by object count.
+def coverage_table(counts, lookup):
+    total = counts['objects'].sum()
+    names = counts.groupby('Object Name')['objects'].sum().sort_values(ascending=False, kind='stable')
+    table = names.reset_index()
+    key = table['Object Name']
+    normalized = key.str.split().str.join(' ').str.casefold()
+
+    exact_qids = pd.Series({name: entry.qid for name, entry in lookup.exact.items()}, dtype=object)
+    normalized_qids = pd.Series({name: entry.qid for name, entry in lookup.normalized.items()}, dtype=object)
+    exact = key.isin(exact_qids.index)
+    listed = exact | normalized.isin(normalized_qids.index)
+    qid = key.map(exact_qids).where(exact, normalized.map(normalized_qids))
+
+    table['qid'] = qid
+    table['status'] = np.select([qid.notna(), listed], ['mapped', 'no QID'], 'missing')
+    table['share'] = table['objects'] / total
+
+    # The most common classifications of each name, as "Prints (1,234), Drawings (12)"
+    ranked = counts.sort_values(['Object Name', 'objects'], ascending=[True, False], kind='stable')
+    top = ranked.groupby('Object Name').head(top_classifications)
+    labels = (top['Classification'].where(top['Classification'] != '', '(none)') + ' (' +
+              top['objects'].map('{:,}'.format) + ')')
+    table['classifications'] = key.map(labels.groupby(top['Object Name']).agg(', '.join))
+    return table
+
+
+# Gaps only, with the share of all objects each would cover and the running total
+def gaps(table, limit=None):
+    missing = table[(table['status'] != 'mapped') & (table['Object Name'] != '')]
+    missing = missing.head(limit) if limit else missing
+    return missing.assign(cumulative=missing['share'].cumsum())
+
+
+def summary(table):
+    total = table['objects'].sum()
+    mapped = table.loc[table['status'] == 'mapped', 'objects'].sum()
+    blank = table.loc[table['Object Name'] == '', 'objects'].sum()
+    return {'objects': int(total), 'names': int((table['Object Name'] != '').sum()),
+            'mapped_objects': int(mapped), 'mapped_share': mapped / total if total else 0.0,
+            'unmapped_names': int(((table['status'] != 'mapped') & (table['Object Name'] != '')).sum()),
+            'blank_objects': int(blank)}
+
+
+def _wiki_cell(value):
+    return str(value).replace('|', '&#124;')
+
+
+def to_wikitable(gap_table, stats):
+    lines = ["{} objects with {} distinct objectNames; {:.1%} of objects have a mapped objectName. "
+             "{} objectNames are unmapped, {} objects have none.".format(
+                 '{:,}'.format(stats['objects']), '{:,}'.format(stats['names']), stats['mapped_share'],
+                 '{:,}'.format(stats['unmapped_names']), '{:,}'.format(stats['blank_objects'])),
+             '',
+             '{| class="wikitable sortable"',
+             '! Rank !! Object Name !! Objects !! Share !! Cumulative !! Status !! Classifications']
+    for rank, row in enumerate(gap_table.itertuples(index=False), 1):
+        lines.append('|-')
+        lines.append('| {} || {} || {:,} || {:.2%} || {:.2%} || {} || {}'.format(
+            rank, _wiki_cell(row[0]), row.objects, row.share, row.cumulative, row.status,
+            _wiki_cell(row.classifications)))
+    lines.append('|}')
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rank the objectNames missing from the crosswalk by object count')
+    parser.add_argument('csv', help='path to the MetObjects.csv Open Access dump')
+    parser.add_argument('--limit', type=int, default=100, help='gaps to list, 0 for all')
+    parser.add_argument('--out', help='write the wikitable here instead of stdout')
+    args = parser.parse_args()
+
+    import batch
+    import httpclient
+    from crosswalk import CrosswalkCache, objectname_crosswalk_page, wikidata_api_url
+
+    config = batch.load_config()
+    httpclient.configure(config)
+    # The current crosswalk, from the snapshot if it is up to date
+    crosswalk_cache = CrosswalkCache(wikidata_api_url, objectname_crosswalk_page,
+                                     snapshot_path=os.path.join(os.path.dirname(__file__),
+                                                                config['CROSSWALK_SNAPSHOT']),
+                                     ttl=0)
+    table = coverage_table(read_counts(args.csv), crosswalk_cache.get_lookup())
+    wikitable = to_wikitable(gaps(table, args.limit), summary(table))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(wikitable)
+    else:
+        sys.stdout.write(wikitable)
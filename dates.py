@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# Parser for the Met's free-text objectDate strings, producing a Wikidata inception (P571) value in
+# Quickstatements syntax at the right precision, with circa (P1480), earliest (P1319) and latest
+# (P1326) date qualifiers. Handles years, circa, ranges (including "1882–89"), decades, centuries
+# (with early/mid/late/halves), BCE/CE, before/after and Egyptian dynasties. A trailing question mark
+# counts as circa.
+#
+# parse_object_date() works on a single string, parse_dates() on a whole pandas column.
+
+import collections
+import functools
+import re
+
+ParsedDate = collections.namedtuple('ParsedDate', ['value', 'qualifiers', 'kind'])
+
+# Wikidata time precisions
+precision_millennium = 6
+precision_century = 7
+precision_decade = 8
+precision_year = 9
+
+circa_qualifier = ('P1480', 'Q5727902')
+earliest_property = 'P1319'
+latest_property = 'P1326'
+
+# Approximate dates of Egyptian dynasties and periods from the Met's chronology, as signed years
+dynasty_years = {
+    'dynasty 1': (-3100, -2900),
+    'dynasty 2': (-2900, -2650),
+    'dynasty 3': (-2650, -2575),
+    'dynasty 4': (-2575, -2465),
+    'dynasty 5': (-2465, -2323),
+    'dynasty 6': (-2323, -2150),
+    'dynasty 11': (-2124, -1981),
+    'dynasty 12': (-1981, -1802),
+    'dynasty 13': (-1802, -1640),
+    'dynasty 17': (-1580, -1550),
+    'dynasty 18': (-1550, -1295),
+    'dynasty 19': (-1295, -1186),
+    'dynasty 20': (-1186, -1070),
+    'dynasty 21': (-1070, -945),
+    'dynasty 22': (-945, -712),
+    'dynasty 25': (-712, -664),
+    'dynasty 26': (-664, -525),
+    'dynasty 27': (-525, -404),
+    'dynasty 30': (-381, -343),
+    'ptolemaic period': (-332, -30),
+}
+
+# Early/mid/late thirds and halves of a century, as (first, last) offsets into its 100 years
+century_parts = {
+    'early': (0, 32),
+    'mid': (33, 65),
+    'late': (66, 99),
+    'first half of the': (0, 49),
+    'second half of the': (50, 99),
+    '1st half of the': (0, 49),
+    '2nd half of the': (50, 99),
+    'first quarter of the': (0, 24),
+    'last quarter of the': (75, 99),
+}
+
+_era = r'(?:\s*(bce|ce))?'
+_era_prefix = r'(?:ce\s+)?'
+_ordinal = r'(\d{1,2})(?:st|nd|rd|th)'
+
+_bce_re = re.compile(r'\b(?:b\.\s?c\.\s?(?:e\.)?|b\.?c\.?e\.?|bc)(?=\s|$|[–,;)])')
+_ce_re = re.compile(r'\b(?:a\.\s?d\.|ad(?=\s)|c\.e\.|ce\b)')
+_dash_re = re.compile(r'\s*[–—-]\s*(?=(?:ca?\.?\s*|ce\s+)?\d)')
+_circa_re = re.compile(r'^(?:ca?\.|ca|circa|about|approx\.)\s*')
+
+_year_re = re.compile(r'^' + _era_prefix + r'(\d{1,4})' + _era + r'$')
+_range_re = re.compile(r'^' + _era_prefix + r'(\d{1,4})' + _era + r'–(?:ca?\.?\s*)?(?:(ce)\s+)?(\d{1,4})' + _era +
+                       r'$')
+_decade_re = re.compile(r'^(?:(early|mid|late)[ –-])?(\d{1,3}0)s' + _era + r'$')
+_century_re = re.compile(r'^(?:(' + '|'.join(sorted(century_parts, key=len, reverse=True)) + r')[ –-])?' +
+                         _ordinal + r' century' + _era + r'$')
+_century_range_re = re.compile(r'^' + _ordinal + r'(?: century)?' + _era + r'–' + _ordinal + r' century' + _era +
+                               r'$')
+_before_after_re = re.compile(r'^(before|after|by)\s+' + _era_prefix + r'(\d{1,4})' + _era + r'$')
+_dynasty_re = re.compile(r'^(dynasty \d{1,2}|ptolemaic period)(?:,.*)?$')
+_trailing_re = re.compile(r'[\s,;.]+$')
+_uncertain_re = re.compile(r'\s*\?$')
+
+
+def wikidata_time(year, precision=precision_year):
+    return '{}{:04d}-00-00T00:00:00Z/{}'.format('-' if year < 0 else '+', abs(year), precision)
+
+
+def _signed(year, era):
+    return -year if era == 'bce' else year
+
+
+# Signed first and last year of a century, e.g. 19 -> (1801, 1900), 3 BCE -> (-300, -201)
+def _century_years(century, bce):
+    if bce:
+        return -century * 100, -(century - 1) * 100 - 1
+    return (century - 1) * 100 + 1, century * 100
+
+
+# Which century/millennium a signed year falls in, counting away from year 1 in either era
+def _unit(year, size):
+    return (year > 0, (abs(year) - 1) // size)
+
+
+# The middle year of a century/millennium, which every convention for rounding such dates agrees on
+def _unit_value(year, size, precision):
+    ce, index = _unit(year, size)
+    middle = index * size + size // 2
+    return wikidata_time(middle if ce else -middle, precision)
+
+
+# The finest value that still covers a whole span of years, or somevalue if it crosses a millennium.
+# A span of at most a century that straddles a century boundary, like 1800–1850 or 1700–1799, gets
+# the century of its middle year rather than a whole millennium.
+def _span_value(earliest, latest):
+    if earliest > 0 and earliest // 10 == latest // 10:
+        return wikidata_time(earliest // 10 * 10, precision_decade)
+    if _unit(earliest, 100) == _unit(latest, 100):
+        return _unit_value(earliest, 100, precision_century)
+    if latest - earliest <= 100:
+        return _unit_value((earliest + latest) // 2, 100, precision_century)
+    if _unit(earliest, 1000) == _unit(latest, 1000):
+        return _unit_value(earliest, 1000, precision_millennium)
+    return 'somevalue'
+
+
+def _span(earliest, latest, circa, kind, value=None):
+    qualifiers = [circa_qualifier] if circa else []
+    qualifiers.append((earliest_property, wikidata_time(earliest)))
+    qualifiers.append((latest_property, wikidata_time(latest)))
+    return ParsedDate(value or _span_value(earliest, latest), tuple(qualifiers), kind)
+
+
+def normalize_date(text):
+    s = ' '.join(text.split()).lower()
+    s = _bce_re.sub('bce', s)
+    s = _ce_re.sub('ce', s)
+    s = _dash_re.sub('–', s)
+    return _trailing_re.sub('', s)
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_object_date(text):
+    if not isinstance(text, str):
+        return None
+    # Fast path for the most common case, a plain year
+    if text.isdigit() and len(text) <= 4:
+        return ParsedDate(wikidata_time(int(text)), (), 'year')
+
+    s = normalize_date(text)
+    circa = False
+    matched = _circa_re.match(s)
+    if matched:
+        circa = True
+        s = s[matched.end():]
+    # A questioned date like 1615? is as uncertain as a circa one
+    matched = _uncertain_re.search(s)
+    if matched:
+        circa = True
+        s = s[:matched.start()]
+    circa_qualifiers = (circa_qualifier,) if circa else ()
+
+    matched = _year_re.match(s)
+    if matched:
+        year = _signed(int(matched.group(1)), matched.group(2))
+        return ParsedDate(wikidata_time(year), circa_qualifiers, 'circa' if circa else 'year')
+
+    matched = _range_re.match(s)
+    if matched:
+        first, first_era, second_prefix, second, second_era = matched.groups()
+        second_era = second_era or second_prefix
+        # Like 1882–89, where the second year only gives the trailing digits
+        if len(second) < len(first) and not (first_era == 'bce' and second_era == 'ce'):
+            second = first[:len(first) - len(second)] + second
+        first_era = first_era or ('bce' if second_era == 'bce' else None)
+        earliest, latest = _signed(int(first), first_era), _signed(int(second), second_era)
+        if earliest > latest:
+            return None
+        return _span(earliest, latest, circa, 'range')
+
+    matched = _decade_re.match(s)
+    if matched:
+        part, decade, era = matched.groups()
+        decade = int(decade)
+        if era == 'bce':
+            return _span(-decade - 9, -decade, circa, 'decade')
+        if part:
+            offsets = {'early': (0, 3), 'mid': (3, 6), 'late': (6, 9)}[part]
+            return _span(decade + offsets[0], decade + offsets[1], circa, 'decade',
+                         value=wikidata_time(decade, precision_decade))
+        return ParsedDate(wikidata_time(decade, precision_decade), circa_qualifiers, 'decade')
+
+    matched = _century_re.match(s)
+    if matched:
+        part, century, era = matched.groups()
+        first, last = _century_years(int(century), era == 'bce')
+        if not part:
+            return ParsedDate(_unit_value(first, 100, precision_century), circa_qualifiers, 'century')
+        start, end = century_parts[part]
+        return _span(first + start, first + end, circa, 'century', value=_unit_value(first, 100, precision_century))
+
+    matched = _century_range_re.match(s)
+    if matched:
+        first_century, first_era, second_century, second_era = matched.groups()
+        first_era = first_era or ('bce' if second_era == 'bce' else None)
+        earliest = _century_years(int(first_century), first_era == 'bce')[0]
+        latest = _century_years(int(second_century), second_era == 'bce')[1]
+        if earliest > latest:
+            return None
+        return _span(earliest, latest, circa, 'century range')
+
+    matched = _before_after_re.match(s)
+    if matched:
+        direction, year, era = matched.groups()
+        year = _signed(int(year), era)
+        prop = earliest_property if direction == 'after' else latest_property
+        return ParsedDate('somevalue', circa_qualifiers + ((prop, wikidata_time(year)),), direction)
+
+    matched = _dynasty_re.match(s)
+    if matched:
+        years = dynasty_years.get(matched.group(1))
+        if years:
+            return _span(years[0], years[1], True, 'dynasty')
+
+    return None
+
+
+# Parse a whole pandas Series of objectDate strings. Each distinct string is only parsed once, which
+# is what makes this fast: a full Met dump has ~500k rows but far fewer distinct date strings.
+def parse_dates(values):
+    import pandas as pd
+
+    values = pd.Series(values)
+    uniques = values.dropna().unique()
+    parsed = {text: parse_object_date(text) for text in uniques}
+    results = [parsed.get(text) if isinstance(text, str) else None for text in values]
+    return pd.DataFrame({'value': [p.value if p else None for p in results],
+                         'qualifiers': [p.qualifiers if p else None for p in results],
+                         'kind': [p.kind if p else None for p in results]}, index=values.index)
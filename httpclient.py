@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# Shared HTTP client for every outbound call: one keep-alive session, a token bucket per host so
+# we stay under the rate limits of query.wikidata.org, the Met API and friends, and retries with
+# exponential backoff that honour Retry-After (including MediaWiki maxlag errors).
+#
+# Module-level get()/post() use a default client, which configure() sets up from config.yaml.
+
+import email.utils
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+default_user_agent = 'GLAMingest/0.1 (https://github.com/fuzheado/glamingest)'
+
+# Statuses worth retrying: rate limited, or a server/gateway error
+retry_statuses = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    # Hold back every caller for this host, e.g. after a Retry-After
+    def pause(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def _is_maxlag(response, kwargs):
+    params = kwargs.get('params') or kwargs.get('data') or {}
+    if not isinstance(params, dict) or 'maxlag' not in params:
+        return False
+    try:
+        return response.json().get('error', {}).get('code') == 'maxlag'
+    except ValueError:
+        return False
+
+
+class HttpClient:
+    # rate_limits maps host -> {'rate': requests per second, 'burst': bucket size}
+    def __init__(self, user_agent=default_user_agent, timeout=20, retries=3, backoff=1.0, rate_limits=None,
+                 pool_size=20):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or {}
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=len(self.rate_limits) + 4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                limit = self.rate_limits.get(host)
+                self._buckets[host] = TokenBucket(limit['rate'], limit.get('burst', 1)) if limit else None
+            return self._buckets[host]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urllib.parse.urlsplit(url).hostname
+        bucket = self._bucket(host)
+        attempt = 0
+        while True:
+            if bucket:
+                bucket.acquire()
+            start = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    metrics.inc('http_errors_total', host=host)
+                    raise
+                metrics.inc('http_retries_total', host=host, reason=type(e).__name__)
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            metrics.observe('http_request_seconds', time.perf_counter() - start, host=host)
+            metrics.inc('http_requests_total', host=host, status=r.status_code)
+
+            maxlag = r.status_code not in retry_statuses and _is_maxlag(r, kwargs)
+            if attempt >= self.retries or not (r.status_code in retry_statuses or maxlag):
+                return r
+            metrics.inc('http_retries_total', host=host, reason='maxlag' if maxlag else r.status_code)
+            delay = _retry_after(r)
+            if delay is None:
+                delay = self.backoff * 2 ** attempt
+            if bucket:
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+
+client = HttpClient()
+
+
+# Replace the default client using the HTTP_* and RATE_LIMITS settings from config.yaml
+def configure(config):
+    global client
+    client = HttpClient(user_agent=config.get('HTTP_USER_AGENT', default_user_agent),
+                        timeout=config.get('HTTP_TIMEOUT', 20),
+                        retries=config.get('HTTP_RETRIES', 3),
+                        backoff=config.get('HTTP_BACKOFF', 1.0),
+                        rate_limits=config.get('RATE_LIMITS'),
+                        pool_size=config.get('HTTP_POOL_SIZE', 20))
+    return client
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return client.head(url, **kwargs)
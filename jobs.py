@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+# Background ingestion jobs for the web app. A job is a range, list or department of Met object IDs,
+# processed by batch.run on a pool of worker threads into files under the jobs directory, with its
+# progress kept in SQLite and each object recorded in the result store. Jobs run one at a time in
+# submission order, and a job that was running when the app stopped picks up from its batch
+# checkpoint on the next start.
+#
+# Several app processes may share the jobs database (e.g. gunicorn workers), so a runner claims a
+# job before running it and keeps a heartbeat on it. A running job is only taken over once its
+# heartbeat is older than the heartbeat timeout, i.e. the process running it has gone.
+
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+import batch
+
+# Output files of a job, by the name they are downloaded as
+output_suffixes = {'qs': '.qs.txt', 'memo': '.memo.jsonl', 'uploads': '.uploads.jsonl'}
+
+unfinished_statuses = ('queued', 'running')
+
+# Most errors kept per job
+max_errors = 1000
+
+
+# Checked, normalized copy of a job source: {'range': [start, end]}, {'ids': [...]} or
+# {'department': name}. Raises ValueError if it is none of those.
+def validate_source(source, max_objects):
+    if not isinstance(source, dict) or len(source) != 1:
+        raise ValueError('give exactly one of range, ids or department')
+    if 'range' in source:
+        if not isinstance(source['range'], list) or len(source['range']) != 2:
+            raise ValueError('range must be two integers [start, end] with start <= end')
+        start, end = source['range']
+        if not isinstance(start, int) or not isinstance(end, int) or end < start:
+            raise ValueError('range must be two integers [start, end] with start <= end')
+        if end - start + 1 > max_objects:
+            raise ValueError('at most {} objects per job'.format(max_objects))
+        return {'range': [start, end]}
+    if 'ids' in source:
+        ids = source['ids']
+        if not isinstance(ids, list) or not ids or not all(isinstance(id, int) for id in ids):
+            raise ValueError('ids must be a non-empty list of integers')
+        if len(ids) > max_objects:
+            raise ValueError('at most {} objects per job'.format(max_objects))
+        return {'ids': ids}
+    if 'department' in source:
+        if not isinstance(source['department'], str) or not source['department'].strip():
+            raise ValueError('department must be a Met department display name')
+        return {'department': source['department'].strip()}
+    raise ValueError('give exactly one of range, ids or department')
+
+
+def resolve_ids(source):
+    if 'range' in source:
+        return list(batch.ids_from_range(*source['range']))
+    if 'ids' in source:
+        return list(dict.fromkeys(source['ids']))
+    return batch.ids_from_department(source['department'])
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, source TEXT NOT NULL, status TEXT NOT NULL, message TEXT,
+                    total INTEGER, processed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,
+                    cancel INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, started REAL, finished REAL,
+                    run_started REAL, run_processed INTEGER NOT NULL DEFAULT 0, owner TEXT, heartbeat REAL);
+                CREATE TABLE IF NOT EXISTS job_errors (job TEXT NOT NULL, metid INTEGER, error TEXT);
+                CREATE INDEX IF NOT EXISTS job_errors_job ON job_errors (job);
+            ''')
+            # Databases created before jobs were claimed
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, type in (('owner', 'TEXT'), ('heartbeat', 'REAL')):
+                if column not in columns:
+                    conn.execute('ALTER TABLE jobs ADD COLUMN {} {}'.format(column, type))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, source):
+        id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, source, status, created) VALUES (?, ?, 'queued', ?)",
+                         (id, json.dumps(source), time.time()))
+        return id
+
+    def get(self, id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['source'] = json.loads(job['source'])
+        return job
+
+    def list(self, limit=50):
+        with self._connect() as conn:
+            ids = [row[0] for row in conn.execute('SELECT id FROM jobs ORDER BY created DESC LIMIT ?', (limit,))]
+        return [self.get(id) for id in ids]
+
+    # Jobs that may be claimed, oldest first: queued ones, and running ones whose runner has gone
+    def claimable(self, stale_after):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND "
+                "(heartbeat IS NULL OR heartbeat < ?)) ORDER BY created", (time.time() - stale_after,))]
+
+    # Atomically make owner the runner of a job (the oldest claimable one if id is None). Returns the
+    # job ID, or None if there was nothing to claim or another runner got there first.
+    def claim(self, owner, stale_after, id=None):
+        now = time.time()
+        with self._connect() as conn:
+            for candidate in [id] if id is not None else self.claimable(stale_after):
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ? WHERE id = ? AND "
+                    "(status = 'queued' OR (status = 'running' AND "
+                    "(owner = ? OR heartbeat IS NULL OR heartbeat < ?)))",
+                    (owner, now, candidate, owner, now - stale_after)).rowcount
+                if claimed:
+                    return candidate
+        return None
+
+    # Keep owner's claim on a job alive. Returns False if another runner has taken the job over.
+    def heartbeat(self, id, owner):
+        with self._connect() as conn:
+            return bool(conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ?',
+                                     (time.time(), id, owner)).rowcount)
+
+    # processed is how many of the job's objects were already done by an earlier run
+    def start(self, id, total, processed):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'running', total = ?, processed = ?, failed = 0, "
+                         "started = COALESCE(started, ?), run_started = ?, run_processed = ? WHERE id = ?",
+                         (total, processed, now, now, processed, id))
+
+    def progress(self, id, processed, failed):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET processed = ?, failed = ? WHERE id = ?', (processed, failed, id))
+
+    def add_error(self, id, metid, error):
+        with self._connect() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM job_errors WHERE job = ?', (id,)).fetchone()[0]
+            if count < max_errors:
+                conn.execute('INSERT INTO job_errors VALUES (?, ?, ?)', (id, metid, error))
+
+    def errors(self, id, limit=20):
+        with self._connect() as conn:
+            return [{'id': metid, 'error': error} for metid, error in conn.execute(
+                'SELECT metid, error FROM job_errors WHERE job = ? ORDER BY rowid DESC LIMIT ?', (id, limit))]
+
+    def clear_errors(self, id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM job_errors WHERE job = ?', (id,))
+
+    # With an owner, the job is only finished if that runner still holds it
+    def finish(self, id, status, message=None, owner=None):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, message = ?, finished = ? WHERE id = ? AND '
+                         '(? IS NULL OR owner = ?)', (status, message, time.time(), id, owner, owner))
+
+    # A queued job is cancelled at once; a running one stops taking new objects. Returns False if
+    # the job has already finished.
+    def request_cancel(self, id):
+        with self._connect() as conn:
+            queued = conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                                  "WHERE id = ? AND status = 'queued'", (time.time(), id)).rowcount
+            running = conn.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND status = 'running'", (id,)).rowcount
+        return bool(queued or running)
+
+    def cancel_requested(self, id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT cancel FROM jobs WHERE id = ?', (id,)).fetchone()
+        return bool(row and row[0])
+
+
+class JobRunner:
+    # heartbeat_timeout is how many seconds without a heartbeat before a running job is taken over
+    def __init__(self, store, process, directory, workers=4, results=None, heartbeat_timeout=120):
+        self.store = store
+        self.results = results
+        self.process = process
+        self.directory = directory
+        self.workers = workers
+        self.heartbeat_timeout = heartbeat_timeout
+        self.owner = '{}:{}'.format(os.getpid(), uuid.uuid4().hex[:8])
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def output_prefix(self, id):
+        return os.path.join(self.directory, id)
+
+    def output_path(self, id, name):
+        return self.output_prefix(id) + output_suffixes[name]
+
+    def submit(self, source):
+        id = self.store.create(source)
+        self.start()
+        return id
+
+    # Start the runner thread if it is not running yet, e.g. to resume jobs left by a previous run
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='jobs', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _loop(self):
+        while True:
+            self._wakeup.clear()
+            id = self.store.claim(self.owner, self.heartbeat_timeout)
+            if id is None:
+                self._wakeup.wait(60)
+                continue
+            # Whatever goes wrong with one job, the thread has to stay up for the others
+            try:
+                self.run_job(id)
+            except Exception as e:
+                print('Job {} failed: {}: {}'.format(id, type(e).__name__, e), file=sys.stderr)
+                self.store.finish(id, 'failed', '{}: {}'.format(type(e).__name__, e), owner=self.owner)
+
+    # Keep the claim on a job alive until stopped is set, setting lost if another runner took it over
+    def _heartbeat(self, id, stopped, lost):
+        while not stopped.wait(self.heartbeat_timeout / 4):
+            if not self.store.heartbeat(id, self.owner):
+                lost.set()
+                return
+
+    def run_job(self, id):
+        if self.store.claim(self.owner, self.heartbeat_timeout, id) is None:
+            return
+        stopped = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(id, stopped, lost), name='jobs-heartbeat',
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            self._run_claimed(id, lost)
+        finally:
+            stopped.set()
+
+    def _run_claimed(self, id, lost):
+        job = self.store.get(id)
+        out = self.output_prefix(id)
+        try:
+            ids = resolve_ids(job['source'])
+        except (ValueError, requests.RequestException) as e:
+            self.store.finish(id, 'failed', str(e), owner=self.owner)
+            return
+        # Objects done before a restart are skipped by batch.run, but still count towards progress
+        done = len(batch.read_checkpoint(out).intersection(ids))
+        self.store.start(id, len(ids), done)
+        self.store.clear_errors(id)
+        # Failed objects are retried when a job is resumed, so failures only count for this run
+        counts = {'processed': done, 'failed': 0}
+
+        def wanted():
+            for metid in ids:
+                if lost.is_set() or self.store.cancel_requested(id):
+                    return
+                yield metid
+
+        def progress(processed, failed):
+            counts['processed'] = done + processed
+            self.store.progress(id, counts['processed'], counts['failed'])
+
+        def failed(metid, error):
+            counts['failed'] += 1
+            self.store.add_error(id, metid, '{}: {}'.format(type(error).__name__, error))
+            self.store.progress(id, counts['processed'], counts['failed'])
+
+        try:
+            # Once another runner has taken the job over, the outputs are its to write
+            batch.run(wanted(), out, self.process, workers=self.workers, progress=progress, on_failed=failed,
+                      store=self.results, stop=lost)
+        except Exception as e:
+            print('Job {} failed: {}: {}'.format(id, type(e).__name__, e), file=sys.stderr)
+            self.store.finish(id, 'failed', '{}: {}'.format(type(e).__name__, e), owner=self.owner)
+            return
+        if not lost.is_set():
+            self.store.finish(id, 'cancelled' if self.store.cancel_requested(id) else 'done', owner=self.owner)
+
+
+# JSON view of a job for /jobs/<id>; output_url(id, name) gives the download URL of an output file
+def job_status(job, errors, output_url):
+    end = job['finished'] if job['status'] not in unfinished_statuses else time.time()
+    elapsed = end - job['run_started'] if job['run_started'] else None
+    run_processed = job['processed'] - job['run_processed']
+    return {'id': job['id'],
+            'status': job['status'],
+            'message': job['message'],
+            'source': job['source'],
+            'total': job['total'],
+            'processed': job['processed'],
+            'failed': job['failed'],
+            'progress': job['processed'] / job['total'] if job['total'] else None,
+            'objects_per_second': run_processed / elapsed if elapsed else None,
+            'created': _isoformat(job['created']),
+            'started': _isoformat(job['started']),
+            'finished': _isoformat(job['finished']),
+            'errors': errors,
+            'output': {name: output_url(job['id'], name) for name in output_suffixes}}
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Persistent cache of Met collection API object responses, shared by the web app and batch jobs.
+# Entries are fresh for a configurable TTL, then revalidated with ETag/Last-Modified when the API
+# gave us those. "Object ID not in use" (404) responses are cached too, with their own TTL, and the
+# least recently used entries are evicted once the cache grows past its size budget.
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+import requests
+
+import httpclient
+import metrics
+
+metapibase = 'https://collectionapi.metmuseum.org/public/collection/v1/objects/'
+
+
+class MetCache:
+    def __init__(self, path, ttl=7 * 24 * 3600, negative_ttl=24 * 3600, max_bytes=512 * 1024 * 1024,
+                 api_base=metapibase, timeout=20):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.api_base = api_base
+        self.timeout = timeout
+        self._stores = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY, status INTEGER NOT NULL, body TEXT NOT NULL,
+                    etag TEXT, last_modified TEXT, fetched REAL NOT NULL, accessed REAL NOT NULL,
+                    size INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+            ''')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _is_fresh(self, status, fetched, now):
+        return now - fetched < (self.ttl if status == 200 else self.negative_ttl)
+
+    # Cached response for an object ID, without going to the network. None if not cached or stale.
+    def peek(self, id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT status, body, fetched FROM responses WHERE id = ?', (id,)).fetchone()
+        if row and self._is_fresh(row[0], row[2], time.time()):
+            return json.loads(row[1])
+        return None
+
+    # Met API JSON for an object ID, from the cache if fresh, otherwise fetched (or revalidated)
+    def get(self, id):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT status, body, etag, last_modified, fetched FROM responses WHERE id = ?',
+                               (id,)).fetchone()
+            if row and self._is_fresh(row[0], row[4], now):
+                conn.execute('UPDATE responses SET accessed = ? WHERE id = ?', (now, id))
+                metrics.cache('met_api', 'hit')
+                return json.loads(row[1])
+
+        headers = {}
+        if row and row[0] == 200:
+            if row[2]:
+                headers['If-None-Match'] = row[2]
+            if row[3]:
+                headers['If-Modified-Since'] = row[3]
+        try:
+            r = httpclient.get(self.api_base + str(id), headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            # Serve a stale copy rather than nothing if the API is unreachable
+            if row:
+                metrics.cache('met_api', 'stale')
+                return json.loads(row[1])
+            raise
+
+        if r.status_code == 304 and row:
+            with self._connect() as conn:
+                conn.execute('UPDATE responses SET fetched = ?, accessed = ? WHERE id = ?', (now, now, id))
+            metrics.cache('met_api', 'revalidated')
+            return json.loads(row[1])
+        if r.status_code not in (200, 404):
+            if row:
+                metrics.cache('met_api', 'stale')
+                return json.loads(row[1])
+            r.raise_for_status()
+        metrics.cache('met_api', 'miss')
+
+        data = r.json()
+        body = json.dumps(data)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (id, r.status_code, body, r.headers.get('ETag'), r.headers.get('Last-Modified'),
+                          now, now, len(body)))
+            # Summing the sizes is a table scan, so only check the budget every so often
+            self._stores += 1
+            if self._stores % 100 == 1:
+                self._evict(conn)
+        return data
+
+    # Treat the cached response as stale, so the next get() revalidates it but can still fall back to it
+    def expire(self, id):
+        with self._connect() as conn:
+            conn.execute('UPDATE responses SET fetched = 0 WHERE id = ?', (id,))
+
+    def invalidate(self, id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses WHERE id = ?', (id,))
+
+    def size(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until back under 90% of the budget, to avoid evicting on every insert
+        excess = total - int(self.max_bytes * 0.9)
+        for id, size in conn.execute('SELECT id, size FROM responses ORDER BY accessed').fetchall():
+            if excess <= 0:
+                break
+            conn.execute('DELETE FROM responses WHERE id = ?', (id,))
+            excess -= size
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+# Local SQLite index of every Wikidata item with a Met object ID (P3634), along with the other
+# properties metid() checks, so looking up whether an object already exists does not need a
+# SPARQL query per object. Built by a paginated sweep, and refreshable for a set of Met IDs.
+#
+#   python metindex.py sweep                  # (re)build the whole index
+#   python metindex.py refresh 436535 436536  # re-query just these Met IDs
+#   python metindex.py duplicates             # Met IDs with more than one Wikidata item
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import time
+
+import httpclient
+
+sparql_api_url = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
+entity_prefix = 'http://www.wikidata.org/entity/'
+
+# Properties kept alongside each item, by the variable name used in the queries
+indexed_properties = {
+    'instance': 'P31',
+    'collection': 'P195',
+    'inventory': 'P217',
+    'location': 'P276',
+    'copyright': 'P6216',
+    'ccurl': 'P4765',
+}
+
+value_separator = '|'
+
+# Full sweep of every item with a Met object ID, paged by LIMIT/OFFSET over a stable ordering.
+# Values are grouped per item so OPTIONALs do not multiply rows - need to double escape {{ and }}
+sweep_query = '''
+SELECT ?item ?metid (GROUP_CONCAT(DISTINCT ?instance; separator="|") AS ?instances)
+  (GROUP_CONCAT(DISTINCT ?collection; separator="|") AS ?collections)
+  (GROUP_CONCAT(DISTINCT ?inventory; separator="|") AS ?inventorys)
+  (GROUP_CONCAT(DISTINCT ?location; separator="|") AS ?locations)
+  (GROUP_CONCAT(DISTINCT ?copyright; separator="|") AS ?copyrights)
+  (GROUP_CONCAT(DISTINCT ?ccurl; separator="|") AS ?ccurls) WHERE {{
+  {selector}
+  OPTIONAL {{ ?item wdt:P31 ?instance }}
+  OPTIONAL {{ ?item wdt:P195 ?collection }}
+  OPTIONAL {{ ?item wdt:P217 ?inventory }}
+  OPTIONAL {{ ?item wdt:P276 ?location }}
+  OPTIONAL {{ ?item wdt:P6216 ?copyright }}
+  OPTIONAL {{ ?item wdt:P4765 ?ccurl }}
+}} GROUP BY ?item ?metid
+{paging}
+'''
+sweep_selector = '?item wdt:P3634 ?metid .'
+sweep_paging = 'ORDER BY ?item LIMIT {} OFFSET {}'
+
+# Refresh of specific Met IDs, batched with VALUES
+values_selector = 'VALUES ?metid {{ {} }} ?item wdt:P3634 ?metid .'
+
+
+def _strip_entity(value):
+    return value[len(entity_prefix):] if value.startswith(entity_prefix) else value
+
+
+# Turn SPARQL bindings (either the grouped rows used here, or the one-row-per-combination rows of
+# the per-object query in metid) into {qid: {property: [values]}}
+def claims_from_bindings(bindings):
+    matches = {}
+    for row in bindings:
+        qid = _strip_entity(row['item']['value'])
+        claims = matches.setdefault(qid, {p: [] for p in indexed_properties.values()})
+        for var, prop in indexed_properties.items():
+            values = []
+            if var in row:
+                values = [row[var]['value']]
+            elif var + 's' in row and row[var + 's']['value']:
+                values = row[var + 's']['value'].split(value_separator)
+            for value in values:
+                value = _strip_entity(value)
+                if value not in claims[prop]:
+                    claims[prop].append(value)
+    return matches
+
+
+class MetIndex:
+    def __init__(self, path, sparql_url=sparql_api_url, timeout=60):
+        self.path = path
+        self.sparql_url = sparql_url
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS items (
+                    metid TEXT NOT NULL, qid TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (metid, qid));
+                CREATE INDEX IF NOT EXISTS items_qid ON items (qid);
+                CREATE TABLE IF NOT EXISTS claims (
+                    qid TEXT NOT NULL, prop TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (qid, prop, value));
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            ''')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _query(self, query):
+        r = httpclient.post(self.sparql_url, data={'query': query, 'format': 'json'}, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()['results']['bindings']
+
+    # True once a full sweep has completed, so a missing Met ID can be trusted as "not on Wikidata"
+    def is_built(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'swept'").fetchone() is not None
+
+    def swept_at(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'swept'").fetchone()
+        return float(row[0]) if row else None
+
+    # Returns {qid: {property: [values]}} for a Met ID, empty if no item has it
+    def lookup(self, metid):
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT items.qid, claims.prop, claims.value FROM items
+                LEFT JOIN claims ON claims.qid = items.qid
+                WHERE items.metid = ?''', (str(metid),)).fetchall()
+        matches = {}
+        for qid, prop, value in rows:
+            claims = matches.setdefault(qid, {p: [] for p in indexed_properties.values()})
+            if prop is not None:
+                claims[prop].append(value)
+        return matches
+
+    # Same as lookup() for many Met IDs at once, returning {metid: matches} for those found
+    def lookup_many(self, metids):
+        metids = [str(m) for m in metids]
+        found = {}
+        with self._connect() as conn:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(metids), 500):
+                batch = metids[start:start + 500]
+                rows = conn.execute('''
+                    SELECT items.metid, items.qid, claims.prop, claims.value FROM items
+                    LEFT JOIN claims ON claims.qid = items.qid
+                    WHERE items.metid IN ({})'''.format(','.join('?' * len(batch))), batch).fetchall()
+                for metid, qid, prop, value in rows:
+                    claims = found.setdefault(metid, {}).setdefault(
+                        qid, {p: [] for p in indexed_properties.values()})
+                    if prop is not None:
+                        claims[prop].append(value)
+        return found
+
+    def contains(self, metid):
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM items WHERE metid = ? LIMIT 1', (str(metid),)).fetchone() is not None
+
+    # Met IDs claimed by more than one item, the TOOMANY case of metid()
+    def duplicates(self):
+        with self._connect() as conn:
+            return conn.execute('''
+                SELECT metid, GROUP_CONCAT(qid) FROM items GROUP BY metid HAVING COUNT(*) > 1
+                ORDER BY CAST(metid AS INTEGER)''').fetchall()
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(DISTINCT metid) FROM items').fetchone()[0]
+
+    # Record SPARQL bindings already fetched for one Met ID, e.g. by the live query in metid()
+    def store(self, metid, bindings):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM items WHERE metid = ?', (str(metid),))
+            for qid, claims in claims_from_bindings(bindings).items():
+                self._store_item(conn, str(metid), qid, claims, time.time())
+
+    def _store_item(self, conn, metid, qid, claims, updated):
+        conn.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?)', (metid, qid, updated))
+        conn.execute('DELETE FROM claims WHERE qid = ?', (qid,))
+        conn.executemany('INSERT OR IGNORE INTO claims VALUES (?, ?, ?)',
+                         [(qid, prop, value) for prop, values in claims.items() for value in values])
+
+    def _store_rows(self, conn, bindings, updated):
+        by_metid = {}
+        for row in bindings:
+            by_metid.setdefault(row['metid']['value'], []).append(row)
+        for metid, rows in by_metid.items():
+            # Keep other items already stored for this Met ID during a sweep, so duplicates spanning
+            # two pages are not lost
+            conn.execute('DELETE FROM items WHERE metid = ? AND updated < ?', (metid, updated))
+            for qid, claims in claims_from_bindings(rows).items():
+                self._store_item(conn, metid, qid, claims, updated)
+
+    # Rebuild the whole index by paging through every item with P3634
+    def sweep(self, page_size=50000, pause=1.0, progress=None):
+        started = time.time()
+        offset = 0
+        while True:
+            bindings = self._query(sweep_query.format(selector=sweep_selector,
+                                                     paging=sweep_paging.format(page_size, offset)))
+            with self._connect() as conn:
+                self._store_rows(conn, bindings, started)
+            if progress:
+                progress(offset + len(bindings))
+            if len(bindings) < page_size:
+                break
+            offset += page_size
+            time.sleep(pause)
+        with self._connect() as conn:
+            # Anything not seen during this sweep has lost its P3634 or been deleted
+            conn.execute('DELETE FROM items WHERE updated < ?', (started,))
+            conn.execute('DELETE FROM claims WHERE qid NOT IN (SELECT qid FROM items)')
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('swept', ?)", (str(started),))
+
+    # Incrementally re-query a set of Met IDs, VALUES-batched
+    def refresh(self, metids, batch_size=200):
+        metids = [str(m) for m in metids]
+        for start in range(0, len(metids), batch_size):
+            batch = metids[start:start + batch_size]
+            bindings = self._query(sweep_query.format(
+                selector=values_selector.format(' '.join('"{}"'.format(m) for m in batch)), paging=''))
+            updated = time.time()
+            with self._connect() as conn:
+                conn.executemany('DELETE FROM items WHERE metid = ?', [(m,) for m in batch])
+                self._store_rows(conn, bindings, updated)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the local Met object ID -> Wikidata index')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(__file__), 'cache', 'metindex.sqlite3'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sweep_parser = subparsers.add_parser('sweep')
+    sweep_parser.add_argument('--page-size', type=int, default=50000)
+    refresh_parser = subparsers.add_parser('refresh')
+    refresh_parser.add_argument('metids', nargs='+')
+    subparsers.add_parser('duplicates')
+    args = parser.parse_args()
+
+    index = MetIndex(args.db)
+    if args.command == 'sweep':
+        index.sweep(page_size=args.page_size, progress=lambda n: print('{} rows'.format(n)))
+        print('{} Met IDs indexed'.format(index.count()))
+    elif args.command == 'refresh':
+        index.refresh(args.metids)
+    else:
+        for metid, qids in index.duplicates():
+            print('{}\t{}'.format(metid, qids))
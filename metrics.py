@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# In-process counters and timing histograms for the hot path (Wikidata/Met/recon calls, caches,
+# outbound HTTP), rendered in the Prometheus text exposition format for the /metrics endpoint.
+# Timings are also collected per request by a Timings object, for the Server-Timing header.
+
+import contextlib
+import threading
+import time
+
+prefix = 'glamingest_'
+
+# Upper bounds in seconds of the timing histogram buckets
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Help text for each metric, which is also the list of metric types
+descriptions = {
+    'stage_seconds': ('histogram', 'Time spent in each stage of processing an object'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'http_requests_total': ('counter', 'Outbound HTTP responses by host and status code'),
+    'http_request_seconds': ('histogram', 'Outbound HTTP request latency by host'),
+    'http_retries_total': ('counter', 'Outbound HTTP retries by host and reason'),
+    'http_errors_total': ('counter', 'Outbound HTTP requests that failed without a response, by host'),
+    'prefetch_cancelled_total': ('counter', 'Queued prefetches cancelled to make room for newer ones'),
+}
+
+
+# Label values are rendered as text anyway, and mixing e.g. status codes and exception names under
+# one label would otherwise break sorting the series
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class Registry:
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    def counter(self, name, **labels):
+        return self._counters.get(_key(name, labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(buckets), count, total))
+                                for key, (buckets, count, total) in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = descriptions.get(name, ('untyped', name))
+                lines.append('# HELP {}{} {}'.format(prefix, name, text))
+                lines.append('# TYPE {}{} {}'.format(prefix, name, kind))
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append('{}{}{} {}'.format(prefix, name, _labels(labels), value))
+        for (name, labels), (buckets, count, total) in histograms:
+            describe(name)
+            for bound, cumulative in zip(self.buckets, buckets):
+                lines.append('{}{}_bucket{} {}'.format(prefix, name, _labels(labels + (('le', repr(bound)),)),
+                                                       cumulative))
+            lines.append('{}{}_bucket{} {}'.format(prefix, name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append('{}{}_sum{} {}'.format(prefix, name, _labels(labels), total))
+            lines.append('{}{}_count{} {}'.format(prefix, name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+
+# Stage timings of a single request, which also feed the process-wide histograms
+class Timings:
+    def __init__(self, metrics_registry=None):
+        self.registry = metrics_registry or registry
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.registry.observe('stage_seconds', seconds, stage=stage)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    # func wrapped to time itself, for work submitted to an executor
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            with self.time(stage):
+                return func(*args, **kwargs)
+        return timed
+
+    # Value for a Server-Timing response header, in milliseconds
+    def server_timing(self):
+        with self._lock:
+            return ', '.join('{};dur={:.1f}'.format(stage, seconds * 1000) for stage, seconds in self.stages.items())
+
+
+registry = Registry()
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def timed(stage):
+    return registry.timed(stage)
+
+
+def cache(name, result):
+    registry.inc('cache_requests_total', cache=name, result=result)
+
+
+def render():
+    return registry.render()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# In-memory cache of rendered /metid pages. A page is only reused while everything it was built
+# from is unchanged: the Met record's metadataDate (from the Met response cache), the crosswalk
+# page revision, what the local Met ID index knows about Wikidata items for the object, and the
+# last revision of those items. The item revisions are what make a page show the edits a volunteer
+# has just made from it; they are fetched with a small wbgetentities request and kept for a short
+# while, so most repeat views make no remote call at all. Pages carry an ETag and Last-Modified, so
+# a browser revalidating a page it already has gets a bodyless 304.
+#
+# Objects without a known item are the ones volunteers are about to create, so their pages are only
+# kept briefly: once the item exists, the next view should go back to SPARQL and show it.
+
+import collections
+import datetime
+import hashlib
+import json
+import threading
+import time
+
+import metrics
+
+# What a rendered page depends on. match is 'unmatched', or a digest of the indexed items and claims,
+# and items the (qid, lastrevid) pairs of the matched items, None if they could not be checked.
+PageKey = collections.namedtuple('PageKey', ['metadata_date', 'revid', 'match', 'items'])
+
+Page = collections.namedtuple('Page', ['key', 'body', 'etag', 'last_modified', 'expires'])
+
+
+def match_state(matches):
+    if not matches:
+        return 'unmatched'
+    return hashlib.sha1(json.dumps(matches, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def page_key(data, revid, matches, lastrevids=()):
+    items = None if lastrevids is None else tuple(sorted(dict(lastrevids).items()))
+    return PageKey(data.get('metadataDate'), revid, match_state(matches), items)
+
+
+def etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+class PageCache:
+    # max_bytes bounds the total size of the cached pages, least recently viewed ones going first.
+    # ttl is the most seconds a page is reused, unmatched_ttl the same for objects with no item.
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, unmatched_ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.unmatched_ttl = unmatched_ttl
+        self.size = 0
+        self._pages = collections.OrderedDict()  # id -> Page
+        self._lock = threading.Lock()
+
+    def __contains__(self, id):
+        with self._lock:
+            return id in self._pages
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pages)
+
+    # The cached page for an ID if it was rendered under the same key and has not expired. A key
+    # whose item revisions are unknown matches whatever revisions the page was rendered with, so
+    # the page is still served while Wikidata cannot be reached.
+    def get(self, id, key):
+        with self._lock:
+            page = self._pages.get(id)
+            if page is None:
+                metrics.cache('page', 'miss')
+                return None
+            current = key if key.items is not None else key._replace(items=page.key.items)
+            if page.key != current or time.time() >= page.expires:
+                self._drop(id)
+                metrics.cache('page', 'stale')
+                return None
+            self._pages.move_to_end(id)
+        metrics.cache('page', 'hit')
+        return page
+
+    def put(self, id, key, body):
+        now = time.time()
+        ttl = self.unmatched_ttl if key.match == 'unmatched' else self.ttl
+        page = Page(key, body, etag(body), datetime.datetime.fromtimestamp(int(now), datetime.timezone.utc),
+                    now + ttl)
+        if ttl <= 0 or len(body) > self.max_bytes:
+            return page
+        with self._lock:
+            self._drop(id)
+            self._pages[id] = page
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._pages)))
+                metrics.inc('page_cache_evicted_total')
+        return page
+
+    # Called with the lock held
+    def _drop(self, id):
+        page = self._pages.pop(id, None)
+        if page is not None:
+            self.size -= len(page.body)
+
+
+# Last revisions of Wikidata items, fetched in one request for the items not seen in the last ttl
+# seconds. fetch is claims.fetch_lastrevids or the like.
+class RevisionCache:
+    def __init__(self, fetch, ttl=30, max_entries=10000):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._revisions = {}  # qid -> (lastrevid, time it was fetched)
+        self._lock = threading.Lock()
+
+    # {qid: lastrevid}. If the fetch fails, revisions older than ttl are used when every item has
+    # one, otherwise the error is raised.
+    def get_many(self, qids):
+        now = time.time()
+        with self._lock:
+            known = {qid: self._revisions[qid] for qid in qids if qid in self._revisions}
+        expired = [qid for qid in qids if qid not in known or now - known[qid][1] >= self.ttl]
+        revisions = {qid: entry[0] for qid, entry in known.items()}
+        if not expired:
+            metrics.cache('item_revision', 'hit')
+            return revisions
+        try:
+            fetched = self.fetch(expired)
+        except Exception:
+            if len(known) < len(qids):
+                raise
+            metrics.cache('item_revision', 'stale')
+            return revisions
+        metrics.cache('item_revision', 'miss')
+        with self._lock:
+            if len(self._revisions) + len(fetched) > self.max_entries:
+                self._revisions = {qid: entry for qid, entry in self._revisions.items() if now - entry[1] < self.ttl}
+            for qid in expired:
+                # Deleted items have no revision, which is a state of its own
+                self._revisions[qid] = (fetched.get(qid), now)
+                revisions[qid] = fetched.get(qid)
+        return revisions
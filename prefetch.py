@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Speculative processing of the objects a volunteer is likely to view next. After a /metid page
+# is rendered, the neighbouring IDs are processed in the background, and the results wait here
+# until they are viewed. Prefetches are bounded, queued ones make way for newer windows once the
+# queue is full, and an ID that is already being processed is never processed twice.
+
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class Prefetcher:
+    def __init__(self, process, workers=2, max_pending=8, ttl=300, max_entries=200):
+        self.process = process
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._ready = collections.OrderedDict()  # id -> (result, monotonic time it was stored)
+        self._pending = collections.OrderedDict()  # id -> Future of a background prefetch
+        self._active = collections.Counter()  # ids being processed for a request right now
+        self._lock = threading.Lock()
+
+    # Result for an ID, and whether it came from a prefetch. A prefetched result is only served
+    # once, so coming back to an object after editing it shows fresh data.
+    def get(self, id):
+        with self._lock:
+            entry = self._ready.pop(id, None)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                metrics.cache('prefetch', 'hit')
+                return entry[0], True
+            future = self._pending.get(id)
+
+        # Already being prefetched, so wait for it rather than doing the same work twice. If it
+        # has not started yet, it is cancelled and processed right here instead.
+        if future is not None and not future.cancel():
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result is not None:
+                with self._lock:
+                    self._ready.pop(id, None)
+                metrics.cache('prefetch', 'in_flight')
+                return result, True
+
+        metrics.cache('prefetch', 'miss')
+        with self._lock:
+            # A cancelled prefetch would otherwise hold its queue slot and block prefetching this ID again
+            if future is not None and future.cancelled() and self._pending.get(id) is future:
+                del self._pending[id]
+            self._active[id] += 1
+        try:
+            return self.process(id), False
+        finally:
+            with self._lock:
+                self._active[id] -= 1
+                if not self._active[id]:
+                    del self._active[id]
+
+    # Queue background processing of ids, in order of preference
+    def prefetch(self, ids):
+        ids = list(ids)
+        with self._lock:
+            for id in ids:
+                if id in self._ready or id in self._pending or id in self._active:
+                    continue
+                if len(self._pending) >= self.max_pending and not self._make_room(ids):
+                    break
+                self._pending[id] = self.executor.submit(self._prefetch_one, id)
+
+    # Cancel the oldest queued prefetch that is not wanted any more. Called with the lock held.
+    def _make_room(self, wanted):
+        for id, future in self._pending.items():
+            if id not in wanted and future.cancel():
+                del self._pending[id]
+                metrics.inc('prefetch_cancelled_total')
+                return True
+        return False
+
+    def _prefetch_one(self, id):
+        try:
+            result = self.process(id)
+        except Exception:
+            with self._lock:
+                self._pending.pop(id, None)
+            raise
+        with self._lock:
+            self._ready[id] = (result, time.monotonic())
+            self._ready.move_to_end(id)
+            while len(self._ready) > self.max_entries:
+                self._ready.popitem(last=False)
+            self._pending.pop(id, None)
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
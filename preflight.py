@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# Pre-flight checks of the images in an upload manifest (the <out>.uploads.jsonl written by batch
+# runs) before they are sent to Commons. Each image gets a HEAD request for its status, type and
+# size, and is then streamed through SHA-1 in fixed-size chunks. The hash is looked up in a local
+# index of the files already on Commons, and each entry is tagged:
+#   upload     the image is fine and not on Commons yet
+#   duplicate  Commons (or an earlier entry of the same manifest) already has this exact file
+#   broken     missing, not an image, empty or truncated
+#
+#   python preflight.py index commons_sha1.tsv.gz       # load a dump of Commons file hashes
+#   python preflight.py check output/run1.uploads.jsonl --out output/run1.preflight.jsonl
+#
+# The dump is tab-separated SHA-1 and file name per line, e.g. from the img_sha1 and img_name
+# columns of the Commons image table, with hashes in MediaWiki's base 36 or in hex.
+
+import argparse
+import collections
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+import requests
+
+import batch
+import httpclient
+
+ImageCheck = collections.namedtuple('ImageCheck', ['status', 'content_type', 'content_length', 'sha1',
+                                                   'duplicate_of', 'error'])
+
+chunk_size = 1 << 16
+
+
+# Hex SHA-1 from either hex or MediaWiki's base 36 form, None if it is neither
+def normalize_sha1(value):
+    value = value.strip().lower()
+    if not value.isalnum() or not value.isascii():
+        return None
+    try:
+        if len(value) == 40:
+            return '{:040x}'.format(int(value, 16))
+        if 0 < len(value) <= 31:
+            number = int(value, 36)
+            if number < 2 ** 160:
+                return '{:040x}'.format(number)
+    except ValueError:
+        pass
+    return None
+
+
+class Sha1Index:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS files (sha1 BLOB PRIMARY KEY, title TEXT) WITHOUT ROWID')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Load (sha1, title) pairs, returning how many were stored
+    def load(self, rows, batch_size=10000):
+        stored = 0
+        with self._connect() as conn:
+            chunk = []
+            for sha1, title in rows:
+                sha1 = normalize_sha1(sha1)
+                if sha1 is None:
+                    continue
+                chunk.append((bytes.fromhex(sha1), title))
+                if len(chunk) >= batch_size:
+                    conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)', chunk)
+                    stored += len(chunk)
+                    chunk = []
+            conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)', chunk)
+            stored += len(chunk)
+        return stored
+
+    def load_dump(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            return self.load(line.rstrip('\n').split('\t', 1) for line in f if '\t' in line)
+
+    # Title of the Commons file with this hex SHA-1, None if there is none
+    def lookup(self, sha1):
+        with self._connect() as conn:
+            row = conn.execute('SELECT title FROM files WHERE sha1 = ?', (bytes.fromhex(sha1),)).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+
+def _broken(error, content_type=None, content_length=None):
+    return ImageCheck('broken', content_type, content_length, None, None, error)
+
+
+def _content_length(response):
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+# Check one image URL. Memory use is bounded by chunk_size whatever the size of the image.
+def check_image(url, index=None, timeout=60):
+    try:
+        r = httpclient.head(url, allow_redirects=True, timeout=timeout)
+        content_type = content_length = None
+        # Some servers do not answer HEAD, in which case the GET below has to tell
+        if r.status_code != 405:
+            if r.status_code != 200:
+                return _broken('HTTP {}'.format(r.status_code))
+            content_type = r.headers.get('Content-Type')
+            content_length = _content_length(r)
+            if content_type and not content_type.startswith('image/'):
+                return _broken('not an image: {}'.format(content_type), content_type, content_length)
+            if content_length == 0:
+                return _broken('empty file', content_type, content_length)
+
+        sha1 = hashlib.sha1()
+        size = 0
+        with httpclient.get(url, stream=True, timeout=timeout) as r:
+            if r.status_code != 200:
+                return _broken('HTTP {}'.format(r.status_code), content_type, content_length)
+            content_type = r.headers.get('Content-Type', content_type)
+            if content_type and not content_type.startswith('image/'):
+                return _broken('not an image: {}'.format(content_type), content_type, content_length)
+            if content_length is None:
+                content_length = _content_length(r)
+            for chunk in r.iter_content(chunk_size):
+                sha1.update(chunk)
+                size += len(chunk)
+    except requests.RequestException as e:
+        return _broken('{}: {}'.format(type(e).__name__, e))
+
+    if size == 0:
+        return _broken('empty file', content_type, content_length)
+    if content_length is not None and size != content_length:
+        return _broken('truncated: {} of {} bytes'.format(size, content_length), content_type, content_length)
+    digest = sha1.hexdigest()
+    existing = index.lookup(digest) if index else None
+    return ImageCheck('duplicate' if existing else 'upload', content_type, size, digest, existing, None)
+
+
+# Check the images of manifest entries concurrently, yielding each entry with its check added under
+# 'preflight' in the order they complete. An image that appears twice in the manifest is only
+# uploaded once: later entries are tagged as duplicates of the first.
+def preflight(entries, index=None, workers=8, timeout=60):
+    seen = {}
+    for entry, check, error in batch.process_iter(entries, lambda entry: check_image(entry['url'], index, timeout),
+                                                  workers=workers):
+        if error is not None:
+            check = _broken('{}: {}'.format(type(error).__name__, error))
+        elif check.status == 'upload':
+            if check.sha1 in seen:
+                check = check._replace(status='duplicate', duplicate_of=seen[check.sha1])
+            else:
+                seen[check.sha1] = entry.get('filename')
+        yield dict(entry, preflight=check._asdict())
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check images before uploading them to Commons')
+    parser.add_argument('--db', help='SHA-1 index of Commons files (default: COMMONS_SHA1_INDEX_PATH)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help='load a dump of Commons file hashes into the index')
+    index_parser.add_argument('dump', help='tab-separated sha1 and file name per line, optionally .gz')
+    check_parser = subparsers.add_parser('check', help='check the images of an upload manifest')
+    check_parser.add_argument('manifest', help='a <out>.uploads.jsonl written by batch.py')
+    check_parser.add_argument('--out', required=True, help='where to write the tagged manifest')
+    check_parser.add_argument('--workers', type=int, help='images checked at once (default: PREFLIGHT_WORKERS)')
+    args = parser.parse_args()
+
+    config = batch.load_config()
+    httpclient.configure(config)
+    index = Sha1Index(args.db or os.path.join(os.path.dirname(__file__), config['COMMONS_SHA1_INDEX_PATH']))
+
+    if args.command == 'index':
+        print('{} hashes loaded, {} in the index'.format(index.load_dump(args.dump), index.count()), file=sys.stderr)
+    else:
+        counts = collections.Counter()
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for entry in preflight(read_manifest(args.manifest), index,
+                                   workers=args.workers or config['PREFLIGHT_WORKERS'],
+                                   timeout=config['HTTP_TIMEOUT']):
+                f.write(json.dumps(entry) + '\n')
+                counts[entry['preflight']['status']] += 1
+        print('{} to upload, {} duplicates, {} broken'.format(counts['upload'], counts['duplicate'],
+                                                              counts['broken']), file=sys.stderr)
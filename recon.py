@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Artist name -> Wikidata reconciliation, using the batched "queries" form of the OpenRefine
+# reconciliation API. Candidates are cached on disk by name and type constraint, so an artist that
+# appears on thousands of objects is only looked up once. Single names looked up at about the same
+# time by different threads (e.g. the workers of a batch run or job) are sent as one batch.
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import httpclient
+import metrics
+
+# Wikidata reconciliation API - mapping names to Q items
+wdreconapi = 'https://tools.wmflabs.org/openrefine-wikidata/en/api'
+
+
+# The candidate to use as creator (P170): one the service flagged as a match, or a top candidate
+# with a high score that is clearly ahead of the runner-up. None if nothing is confident enough.
+def best_match(candidates, min_score=90, margin=10):
+    if not candidates:
+        return None
+    for candidate in candidates:
+        if candidate.get('match'):
+            return candidate
+    top = candidates[0]
+    runner_up = candidates[1]['score'] if len(candidates) > 1 else 0
+    if top['score'] >= min_score and top['score'] - runner_up >= margin:
+        return top
+    return None
+
+
+class ReconCache:
+    def __init__(self, path, ttl=30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS candidates (
+                                name TEXT PRIMARY KEY, candidates TEXT NOT NULL, fetched REAL NOT NULL)''')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Returns {name: candidates} for the names that are cached and fresh
+    def get_many(self, names):
+        names = list(names)
+        found = {}
+        oldest = time.time() - self.ttl
+        with self._connect() as conn:
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                rows = conn.execute('SELECT name, candidates FROM candidates WHERE fetched >= ? AND name IN ({})'
+                                    .format(','.join('?' * len(batch))), [oldest] + batch).fetchall()
+                found.update((name, json.loads(candidates)) for name, candidates in rows)
+        return found
+
+    def put_many(self, results):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO candidates VALUES (?, ?, ?)',
+                             [(name, json.dumps(candidates), now) for name, candidates in results.items()])
+
+
+# Items of this type (human) are the only candidates that can become a creator (P170), rather than
+# e.g. a painting or an organisation with the same name
+human_type = 'Q5'
+
+
+class Reconciler:
+    # type is the item type candidates are constrained to, None for any. reconcile() waits up to
+    # coalesce_delay seconds for other threads' names to send with its own, 0 to send them at once.
+    def __init__(self, cache, api_url=wdreconapi, batch_size=25, limit=5, type=human_type, coalesce_delay=0):
+        self.cache = cache
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.limit = limit
+        self.type = type
+        self.coalesce_delay = coalesce_delay
+        self._batch = None  # names waiting to be sent together, see reconcile()
+        self._batch_lock = threading.Lock()
+
+    def _query(self, names):
+        queries = {}
+        for i, name in enumerate(names):
+            queries['q{}'.format(i)] = {'query': name, 'limit': self.limit}
+            if self.type:
+                queries['q{}'.format(i)]['type'] = self.type
+        r = httpclient.post(self.api_url, data={'queries': json.dumps(queries)})
+        r.raise_for_status()
+        results = r.json()
+        return {name: results.get('q{}'.format(i), {}).get('result', []) for i, name in enumerate(names)}
+
+    # Candidates of a query without a type constraint are cached under the bare name
+    def _cache_key(self, name):
+        return '{}:{}'.format(self.type, name) if self.type else name
+
+    # Returns {name: [candidates]} for every name, querying the service only for uncached names
+    def reconcile_many(self, names):
+        names = sorted({name for name in names if name})
+        cached = self.cache.get_many(self._cache_key(name) for name in names)
+        results = {name: cached[self._cache_key(name)] for name in names if self._cache_key(name) in cached}
+        missing = [name for name in names if name not in results]
+        metrics.inc('cache_requests_total', len(results), cache='recon', result='hit')
+        metrics.inc('cache_requests_total', len(missing), cache='recon', result='miss')
+        for start in range(0, len(missing), self.batch_size):
+            fetched = self._query(missing[start:start + self.batch_size])
+            self.cache.put_many({self._cache_key(name): candidates for name, candidates in fetched.items()})
+            results.update(fetched)
+        return results
+
+    def reconcile(self, name):
+        if not self.coalesce_delay or not name:
+            return self.reconcile_many([name]).get(name, [])
+        cached = self.cache.get_many([self._cache_key(name)])
+        if cached:
+            metrics.inc('cache_requests_total', cache='recon', result='hit')
+            return cached[self._cache_key(name)]
+
+        # The first thread to need a name opens a batch and sends it once it is full or the delay is
+        # up; the threads that join it in the meantime wait for its results
+        with self._batch_lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = {'names': set(), 'full': threading.Event(), 'done': threading.Event()}
+            batch['names'].add(name)
+            if len(batch['names']) >= self.batch_size:
+                self._batch = None
+                batch['full'].set()
+        if leader:
+            batch['full'].wait(self.coalesce_delay)
+            with self._batch_lock:
+                if self._batch is batch:
+                    self._batch = None
+            try:
+                batch['results'] = self.reconcile_many(batch['names'])
+            except Exception as e:
+                batch['error'] = e
+            batch['done'].set()
+        else:
+            batch['done'].wait()
+        if 'error' in batch:
+            raise batch['error']
+        return batch['results'].get(name, [])
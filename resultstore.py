@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Columnar store of processed objects, so subsets can be re-exported without re-running a batch.
+# Batch runs and /jobs append one row per object to an SQLite table with a typed column for each
+# field worth filtering on, plus the QuickStatements and memo as JSON. Rows are never updated: an
+# object processed again gets a new row, and exports use the latest row of each object.
+#
+#   python resultstore.py export --status new --public-domain --department "European Paintings" \
+#       --date parsed --out paintings.qs.txt
+#   python resultstore.py export --status existing --format csv --out existing.csv
+#   python resultstore.py export --memo "Date: Skipping" --format jsonl --out complex_dates.jsonl
+#   python resultstore.py count --status duplicates
+#
+# Exports stream from an SQLite cursor, so memory use does not grow with the number of records.
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import batch
+from transform import match_status
+
+# Scalar columns, in the order they are exported to CSV
+columns = ['id', 'run', 'recorded', 'found', 'status', 'qid', 'qs_subject', 'public_domain', 'department',
+           'object_name', 'classification', 'title', 'accession', 'object_date', 'date_kind', 'statement_count']
+json_columns = ['qs', 'memo', 'upload']
+insert_sql = 'INSERT INTO results VALUES ({})'.format(', '.join('?' * (len(columns) + len(json_columns))))
+
+schema = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER NOT NULL,
+    run TEXT,
+    recorded REAL NOT NULL,
+    found INTEGER NOT NULL,
+    status TEXT,
+    qid TEXT,
+    qs_subject TEXT,
+    public_domain INTEGER,
+    department TEXT,
+    object_name TEXT,
+    classification TEXT,
+    title TEXT,
+    accession TEXT,
+    object_date TEXT,
+    date_kind TEXT,
+    statement_count INTEGER,
+    qs TEXT,
+    memo TEXT,
+    upload TEXT
+);
+CREATE INDEX IF NOT EXISTS results_id ON results (id);
+CREATE INDEX IF NOT EXISTS results_status ON results (status, department);
+CREATE INDEX IF NOT EXISTS results_department ON results (department);
+'''
+
+# Values of the date filter besides a ParsedDate kind such as 'year' or 'circa'
+date_filters = {'parsed': "date_kind IS NOT NULL AND date_kind != 'complex'",
+                'complex': "date_kind = 'complex'",
+                'none': 'date_kind IS NULL'}
+
+
+# Table row for a process_metid/transform_object result
+def result_row(result, run=None):
+    data = result.get('data') or {}
+    found = 'objectID' in data
+    public_domain = data.get('isPublicDomain')
+    return (result['id'], run, time.time(), int(found),
+            match_status(result) if found and 'create' in result else None,
+            result.get('qid') or None, result.get('qs_subject'),
+            None if public_domain is None else int(bool(public_domain)),
+            data.get('department') or None, data.get('objectName') or None, data.get('classification') or None,
+            data.get('title') or None, data.get('accessionNumber') or None, data.get('objectDate') or None,
+            result.get('date_kind'), len(result.get('statements') or []),
+            json.dumps(result.get('qs') or []), json.dumps(result.get('memo') or []),
+            json.dumps(result['upload']) if result.get('upload') else None)
+
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            # Lets exports read while a batch run or job is appending
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(schema)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, results, run=None):
+        with self._connect() as conn:
+            conn.executemany(insert_sql, (result_row(result, run) for result in results))
+
+    # Writer for a batch run or job, committing each object as it is written
+    def writer(self, run=None):
+        return ResultWriter(self.path, run)
+
+    # WHERE clause and parameters for the export filters, matching the latest row of each object
+    @staticmethod
+    def _where(status=None, public_domain=None, department=None, object_name=None, classification=None,
+               date=None, memo=None, run=None, found=True):
+        clauses = ['rowid = (SELECT MAX(rowid) FROM results AS latest WHERE latest.id = results.id)']
+        params = []
+        for column, value in (('status', status), ('department', department), ('object_name', object_name),
+                              ('classification', classification), ('run', run)):
+            if value is not None:
+                clauses.append('{} = ?'.format(column))
+                params.append(value)
+        if public_domain is not None:
+            clauses.append('public_domain = ?')
+            params.append(int(public_domain))
+        if found is not None:
+            clauses.append('found = ?')
+            params.append(int(found))
+        if date is not None:
+            if date in date_filters:
+                clauses.append(date_filters[date])
+            else:
+                clauses.append('date_kind = ?')
+                params.append(date)
+        if memo is not None:
+            clauses.append("memo LIKE ? ESCAPE '\\'")
+            params.append('%' + memo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        return ' AND '.join(clauses), params
+
+    # Latest record of each object matching the filters (see _where), in object ID order
+    def iter_records(self, limit=None, **filters):
+        where, params = self._where(**filters)
+        sql = 'SELECT {} FROM results WHERE {} ORDER BY id'.format(', '.join(columns + json_columns), where)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._connect() as conn:
+            for row in conn.execute(sql, params):
+                record = dict(zip(columns + json_columns, row))
+                for column in json_columns:
+                    if record[column] is not None:
+                        record[column] = json.loads(record[column])
+                yield record
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM results WHERE ' + where, params).fetchone()[0]
+
+
+class ResultWriter:
+    def __init__(self, path, run=None):
+        self.run = run
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # In WAL mode this only gives up durability on power loss, not when the process dies, and
+        # saves a sync per object
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def write(self, result):
+        with self.conn:
+            self.conn.execute(insert_sql, result_row(result, self.run))
+
+    def close(self):
+        self.conn.close()
+
+
+def is_emittable(record):
+    return bool(record['found']) and record['qs_subject'] not in batch.unsafe_subjects
+
+
+# Write records in one of the export formats, returning how many were written:
+#   qs       QuickStatements of the records that are safe to send as-is
+#   jsonl    one record per line, with its QuickStatements and memo
+#   csv      the scalar columns
+#   uploads  a Commons upload manifest, as <out>.uploads.jsonl of batch runs
+def export(records, f, format='qs'):
+    written = 0
+    writer = csv.writer(f) if format == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    for record in records:
+        if format == 'qs':
+            if not is_emittable(record) or not record['qs']:
+                continue
+            f.write('\n'.join(record['qs']) + '\n')
+        elif format == 'jsonl':
+            f.write(json.dumps(record) + '\n')
+        elif format == 'csv':
+            writer.writerow([record[column] for column in columns])
+        elif format == 'uploads':
+            if not record['upload']:
+                continue
+            f.write(json.dumps(record['upload']) + '\n')
+        else:
+            raise ValueError('Unknown export format: {}'.format(format))
+        written += 1
+    return written
+
+
+def add_filter_arguments(parser):
+    parser.add_argument('--status', choices=['new', 'existing', 'duplicates', 'unchecked'],
+                        help='match state against Wikidata; new means no item was found')
+    public_domain = parser.add_mutually_exclusive_group()
+    public_domain.add_argument('--public-domain', dest='public_domain', action='store_true', default=None)
+    public_domain.add_argument('--not-public-domain', dest='public_domain', action='store_false')
+    parser.add_argument('--department', help='Met department display name, e.g. "European Paintings"')
+    parser.add_argument('--object-name', help='Met objectName, e.g. "Painting"')
+    parser.add_argument('--classification', help='Met classification, e.g. "Paintings"')
+    parser.add_argument('--date', help='parsed, complex, none, or a date kind such as year, decade or circa')
+    parser.add_argument('--memo', help='text that one of the memo lines contains')
+    parser.add_argument('--run', help='only objects last processed by this run (the --out of batch.py, or job ID)')
+
+
+def filter_arguments(args):
+    return {key: getattr(args, key) for key in ('status', 'public_domain', 'department', 'object_name',
+                                                'classification', 'date', 'memo', 'run')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export subsets of processed objects')
+    parser.add_argument('--db', help='result store (default: RESULTS_PATH)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='write the records matching the filters')
+    add_filter_arguments(export_parser)
+    export_parser.add_argument('--format', choices=['qs', 'jsonl', 'csv', 'uploads'], default='qs')
+    export_parser.add_argument('--limit', type=int)
+    export_parser.add_argument('--out', help='output file (default: standard output)')
+    count_parser = subparsers.add_parser('count', help='count the records matching the filters')
+    add_filter_arguments(count_parser)
+    args = parser.parse_args()
+
+    config = batch.load_config()
+    store = ResultStore(args.db or os.path.join(os.path.dirname(__file__), config['RESULTS_PATH']))
+    if args.command == 'count':
+        print(store.count(**filter_arguments(args)))
+    else:
+        records = store.iter_records(limit=args.limit, **filter_arguments(args))
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8', newline='' if args.format == 'csv' else None) as f:
+                written = export(records, f, args.format)
+        else:
+            written = export(records, sys.stdout, args.format)
+        print('{} records exported'.format(written), file=sys.stderr)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# Incremental sync from the Met API change feed. /objects?metadataDate=YYYY-MM-DD lists the object
+# IDs whose metadata changed since that date, so a nightly run only re-processes those, compares
+# the statements against what earlier runs emitted, and writes QuickStatements for just the new or
+# changed ones. The date of the last complete run is kept as a high-water mark.
+#
+#   python sync.py --since 2024-01-01 --out output/sync   # first run
+#   python sync.py --out output/sync                      # later runs continue from the mark
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import batch
+import httpclient
+
+
+# A statement without its subject, so it compares equal before and after the item is created
+def statement_key(st):
+    return '|'.join([st.prop, st.value] + [part for qualifier in st.qualifiers for part in qualifier])
+
+
+def ids_changed_since(date, timeout=60):
+    r = httpclient.get(batch.metapi_root + 'objects', params={'metadataDate': date.isoformat()}, timeout=timeout)
+    r.raise_for_status()
+    return sorted(r.json()['objectIDs'] or [])
+
+
+class SyncState:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS emitted (
+                    id INTEGER PRIMARY KEY, qs_subject TEXT, statements TEXT NOT NULL, updated REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            ''')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Date of the last complete sync, None if there has not been one
+    def high_water_mark(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'high_water_mark'").fetchone()
+        return datetime.date.fromisoformat(row[0]) if row else None
+
+    def set_high_water_mark(self, date):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('high_water_mark', ?)", (date.isoformat(),))
+
+    # Statement keys previously emitted for an object ID, None if it was never emitted
+    def emitted(self, id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT statements FROM emitted WHERE id = ?', (id,)).fetchone()
+        return set(json.loads(row[0])) if row else None
+
+    def record(self, id, qs_subject, keys):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO emitted VALUES (?, ?, ?, ?)',
+                         (id, qs_subject, json.dumps(sorted(keys)), time.time()))
+
+
+# Cut a processed result down to the statements that were not emitted before. New items keep all
+# of them, since CREATE needs the full set. So do existing items whose statements were already cut
+# down to what the item is missing: a statement emitted before but still missing was never applied,
+# and suppressing it would lose it for good. Otherwise only new or changed statements remain.
+def diff_result(result, state):
+    keys = [statement_key(st) for st in result['statements']]
+    previous = state.emitted(result['id'])
+    result['sync_keys'] = keys
+    if previous is None or result.get('create'):
+        return result
+    if result.get('missing_only'):
+        repeated = previous.intersection(keys)
+        if repeated:
+            result['memo'].append('Sync: {} statement(s) emitted before are still missing, emitted again'.format(
+                len(repeated)))
+        return result
+
+    statements = [st for st, key in zip(result['statements'], keys) if key not in previous]
+    dropped = previous.difference(keys)
+    result['statements'] = statements
+    result['qs'] = ['{}|{}'.format(result['qs_subject'], key) for key in keys if key not in previous]
+    result['memo'].append('Sync: {} new or changed statement(s), {} unchanged'.format(
+        len(statements), len(keys) - len(statements)))
+    if dropped:
+        result['memo'].append('Sync: no longer generated, not removed: {}'.format(', '.join(sorted(dropped))))
+    return result
+
+
+def sync(out, state, process, since, workers=4, progress=None, refetch=None):
+    started = datetime.date.today()
+    ids = ids_changed_since(since)
+
+    def process_changed(id):
+        # The object changed at the Met, so revalidate the cached response instead of trusting it
+        if refetch:
+            refetch(id)
+        return diff_result(process(id), state)
+
+    def written(result):
+        if batch.is_emittable(result):
+            state.record(result['id'], result['qs_subject'], result['sync_keys'])
+
+    processed, failed = batch.run(ids, out, process_changed, workers=workers, progress=progress,
+                                  on_written=written)
+    # Only move the mark forward once every changed object made it through, so failures are retried
+    if not failed:
+        state.set_high_water_mark(started)
+    return len(ids), processed, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='QuickStatements for Met objects changed since the last sync')
+    parser.add_argument('--out', required=True, help='output path prefix, the run date and time are appended')
+    parser.add_argument('--since', type=datetime.date.fromisoformat,
+                        help='YYYY-MM-DD to sync from, instead of the stored high-water mark')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    config = batch.load_config()
+    httpclient.configure(config)
+
+    state = SyncState(os.path.join(os.path.dirname(__file__), config['SYNC_STATE_PATH']))
+    since = args.since or state.high_water_mark()
+    if since is None:
+        parser.error('no previous sync recorded, so --since is required')
+
+    # Imported here so --help does not pay for loading the app
+    from app import met_cache, process_metid
+
+    def report(processed, failed):
+        if processed % 100 == 0:
+            print('{} processed, {} failed'.format(processed, failed), file=sys.stderr)
+
+    # The time keeps a second run on the same day from skipping objects in the first run's .done file
+    out = '{}-{}'.format(args.out, datetime.datetime.now().strftime('%Y-%m-%dT%H%M%S'))
+    changed, processed, failed = sync(out, state, process_metid, since, workers=args.workers, progress=report,
+                                      refetch=met_cache.expire)
+    print('Done: {} changed since {}, {} processed, {} failed'.format(changed, since, processed, failed),
+          file=sys.stderr)
@@ -1,6 +1,162 @@
-from unittest import TestCase
+import json
+import subprocess
+import sys
+import time
+from concurrent import futures
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+
+import app
+import jobs
+from benchmarks.fakeservices import FakeServices, default_latency
+from prefetch import Prefetcher
+from test_transform import lookup, met_object
+
+
+def fake_process(id):
+    if id == 3:
+        raise ValueError('boom')
+    with mock.patch('transform.best_match', return_value=None):
+        result = app.transform_object(id, dict(met_object, objectID=id), lookup=lookup)
+    result.update({'data': dict(met_object, objectID=id), 'metapicall': '', 'metobjcall': ''})
+    return result
 
 
 class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.services = FakeServices(latency={service: 0 for service in default_latency}).start()
+        self.patcher = mock.patch.multiple(app, **self.services.app_overrides(self.tmpdir.name))
+        self.patcher.start()
+        self.config = mock.patch.dict(app.app.config, PREFETCH_AHEAD=0)
+        self.config.start()
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        self.config.stop()
+        self.patcher.stop()
+        self.services.stop()
+        self.tmpdir.cleanup()
+
     def test_metid(self):
-        self.fail()
+        response = self.client.get('/metid/1')
+        html = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('CREATE', html)
+        self.assertIn('LAST|P31|Q241045', html)
+        self.assertIn('metindex;dur=', response.headers['Server-Timing'])
+
+    def test_metid_existing_item(self):
+        response = self.client.get('/metid/3')
+        html = response.get_data(as_text=True)
+        self.assertNotIn('CREATE', html)
+        self.assertIn('Q90000003|P3634', html)
+        # The item already has a label
+        self.assertNotIn('Q90000003|Len|', html)
+        # Served from the index and the Met response cache the second time
+        self.client.get('/metid/3')
+        self.assertEqual(self.services.requests['sparql'], 1)
+        self.assertEqual(self.services.requests['met'], 1)
+
+    def test_metid_page_cache(self):
+        response = self.client.get('/metid/3')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+
+        # Nothing changed, so the rendered page is reused, or not even sent again, without remote calls
+        wiki_requests = self.services.requests['wiki']
+        response = self.client.get('/metid/3')
+        self.assertTrue(response.headers['Server-Timing'].startswith('page_cache;'))
+        self.assertEqual(response.headers['ETag'], etag)
+        response = self.client.get('/metid/3', headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.get_data()), (304, b''))
+        self.assertEqual(self.services.requests['wiki'], wiki_requests)
+
+        # While Wikidata cannot be reached, the page is still served
+        app.item_revisions.ttl = 0
+        with mock.patch('app.fetch_lastrevids', side_effect=requests.ConnectionError('down')):
+            self.assertEqual(self.client.get('/metid/3', headers={'If-None-Match': etag}).status_code, 304)
+
+        # An edit to the item, e.g. running the QuickStatements shown, means the page is built again
+        # once the item's revision is checked
+        self.services.item_revid = 2
+        response = self.client.get('/metid/3', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('metindex;dur=', response.headers['Server-Timing'])
+
+        # ... and so does a new crosswalk revision
+        self.services.crosswalk_revid = 2
+        app.crosswalk_cache.refresh()
+        response = self.client.get('/metid/3')
+        self.assertIn('metindex;dur=', response.headers['Server-Timing'])
+        self.assertEqual(self.services.requests['met'], 1)
+
+    def test_crosswalk_refresh_is_post_only(self):
+        self.assertEqual(self.client.get('/crosswalk/refresh').status_code, 405)
+        self.assertEqual(self.client.post('/crosswalk/refresh').get_json()['revid'], 1)
+
+    def test_metid_prefetches_next(self):
+        prefetcher = Prefetcher(app.process_metid, workers=1)
+        with mock.patch('app.prefetcher', prefetcher), mock.patch.dict(app.app.config, PREFETCH_AHEAD=2):
+            self.client.get('/metid/1')
+            futures.wait(list(prefetcher._pending.values()))
+            met_requests = self.services.requests['met']
+            self.assertEqual(met_requests, 4)
+            response = self.client.get('/metid/2')
+        prefetcher.shutdown()
+        self.assertIn('LAST|P3634|&#34;2&#34;', response.get_data(as_text=True))
+        self.assertEqual(self.services.requests['met'], met_requests)
+        self.assertTrue(response.headers['Server-Timing'].startswith('prefetch_wait;'))
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+
+    def test_metid_json(self):
+        with mock.patch('app.process_metid', fake_process):
+            data = self.client.get('/api/metid/436535').get_json()
+        self.assertEqual(data['status'], 'new')
+        self.assertEqual(data['qs'][0], 'CREATE')
+        self.assertIn({'property': 'P31', 'value': 'Q3305213', 'qualifiers': []}, data['statements'])
+        self.assertEqual(data['commons']['upload']['filename'], 'Wheat Field with Cypresses - MET 1993.132.jpg')
+
+    def test_metrange_streams_ndjson(self):
+        with mock.patch('app.process_metid', fake_process):
+            response = self.client.get('/api/metrange?start=1&end=5')
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(sorted(line['id'] for line in lines), [1, 2, 3, 4, 5])
+        self.assertEqual([line['error'] for line in lines if 'error' in line], ['ValueError: boom'])
+        self.assertEqual(self.client.get('/api/metrange?start=5&end=1').status_code, 400)
+
+    def test_jobs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            runner = jobs.JobRunner(jobs.JobStore(directory + '/jobs.sqlite3'), fake_process, directory)
+            with mock.patch('app.job_runner', runner):
+                response = self.client.post('/jobs', json={'range': [1, 5]})
+                self.assertEqual(response.status_code, 202)
+                url = response.get_json()['url']
+                for _ in range(100):
+                    status = self.client.get(url).get_json()
+                    if status['status'] == 'done':
+                        break
+                    time.sleep(0.05)
+                self.assertEqual((status['processed'], status['failed']), (4, 1))
+                self.assertEqual(status['errors'], [{'id': 3, 'error': 'ValueError: boom'}])
+                qs = self.client.get(status['output']['qs']).get_data(as_text=True)
+                self.assertEqual(qs.count('CREATE'), 4)
+                self.assertEqual(self.client.post('/jobs', json={'range': [5, 1]}).status_code, 400)
+                self.assertEqual(self.client.get('/jobs/nope').status_code, 404)
+
+
+class TestStartup(TestCase):
+    # pandas and the wikitext parser are only needed when the crosswalk has to be parsed
+    def test_import_leaves_heavy_modules_unloaded(self):
+        output = subprocess.run([sys.executable, '-c', 'import sys, app; print(sorted(m for m in ('
+                                 '"pandas", "numpy", "mwparserfromhell", "wikitables") if m in sys.modules))'],
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+import batch
+
+
+def fake_process(id):
+    if id == 3:
+        raise ValueError('boom')
+    data = {'objectID': id} if id != 4 else {'message': 'ObjectID not found'}
+    upload = {'id': id, 'url': 'https://images.metmuseum.org/{}.jpg'.format(id)} if id == 2 else None
+    return {'id': id, 'data': data, 'qid': '', 'qs_subject': 'LAST',
+            'qs': ['CREATE', 'LAST|P3634|"{}"'.format(id)], 'memo': ['memo {}'.format(id)], 'upload': upload}
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.tmpdir.name, 'run')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_streams_outputs_and_resumes(self):
+        self.assertEqual(batch.run(batch.ids_from_range(1, 5), self.out, fake_process, workers=2), (4, 1))
+        with open(self.out + '.qs.txt') as f:
+            self.assertEqual(f.read().count('CREATE'), 3)
+        with open(self.out + '.memo.jsonl') as f:
+            memos = {m['id']: m for m in map(json.loads, f)}
+        self.assertFalse(memos[4]['emitted'])
+        with open(self.out + '.uploads.jsonl') as f:
+            self.assertEqual([u['id'] for u in map(json.loads, f)], [2])
+
+        # Only the failed object is retried on a second run
+        seen = []
+        batch.run(batch.ids_from_range(1, 5), self.out, lambda id: seen.append(id) or fake_process(id))
+        self.assertEqual(seen, [3])
+
+    def test_incomplete_results_are_retried(self):
+        def process(id):
+            return dict(fake_process(id), failed=['Crosswalk'] if id == 2 else [])
+
+        failures = []
+        self.assertEqual(batch.run([1, 2], self.out, process, on_failed=lambda id, e: failures.append((id, str(e)))),
+                         (1, 1))
+        self.assertEqual(failures, [(2, 'request failed: Crosswalk')])
+        self.assertEqual(batch.read_checkpoint(self.out), {1})
+        with open(self.out + '.qs.txt') as f:
+            self.assertEqual(f.read().count('CREATE'), 1)
+
+    def test_stop(self):
+        stop = threading.Event()
+
+        def process(id):
+            if id == 2:
+                stop.set()
+            return fake_process(id)
+
+        processed, failed = batch.run([1, 2, 5, 6], self.out, process, workers=1, stop=stop)
+        # Whatever finished after the stop is not written
+        self.assertLessEqual(batch.read_checkpoint(self.out), {1})
+        self.assertEqual((processed, failed), (len(batch.read_checkpoint(self.out)), 0))
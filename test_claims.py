@@ -0,0 +1,56 @@
+from unittest import TestCase, mock
+
+import claims
+from test_transform import lookup, met_object
+from transform import transform_object
+
+
+def snak(prop, datavalue, type='wikibase-entityid'):
+    return {'snaktype': 'value', 'property': prop, 'datavalue': {'type': type, 'value': datavalue}}
+
+
+entity = {
+    'id': 'Q1231009',
+    'labels': {'en': {'language': 'en', 'value': 'Wheat Field with Cypresses'}},
+    'claims': {
+        'P31': [{'mainsnak': snak('P31', {'id': 'Q3305213'})}],
+        'P217': [{'mainsnak': snak('P217', '1993.132', 'string'),
+                  'qualifiers': {'P195': [snak('P195', {'id': 'Q160236'})]}}],
+        'P571': [{'mainsnak': snak('P571', {'time': '+1889-01-01T00:00:00Z', 'precision': 9}, 'time')}],
+    },
+}
+
+
+class TestClaims(TestCase):
+    def test_fetch_claims_in_batches(self):
+        def _get(url, params=None, **kwargs):
+            response = mock.Mock(status_code=200)
+            ids = params['ids'].split('|')
+            response.json.return_value = {'entities': {qid: dict(entity, id=qid) if qid != 'Q3' else
+                                                       {'id': qid, 'missing': ''} for qid in ids}}
+            return response
+
+        with mock.patch('httpclient.get', side_effect=_get) as get:
+            found = claims.fetch_claims(['Q{}'.format(i) for i in range(1, 121)])
+        self.assertEqual([len(c.kwargs['params']['ids'].split('|')) for c in get.call_args_list], [50, 50, 20])
+        self.assertEqual(len(found), 119)
+        self.assertEqual(found['Q1']['P217'], {'1993.132': {('P195', 'Q160236')}})
+        self.assertEqual(found['Q1']['P571'], {'+1889-00-00T00:00:00Z/9': set()})
+
+    def test_only_missing_statements_for_existing_item(self):
+        met = dict(met_object, objectDate='ca. 1889')
+        result = transform_object(436535, met, lookup=lookup, matches={'Q1231009': {}},
+                                  claims=claims.claims_from_entity(entity))
+        self.assertNotIn('Q1231009|P31|Q3305213', result['qs'])
+        self.assertNotIn('Q1231009|P217|"1993.132"|P195|Q160236', result['qs'])
+        self.assertNotIn('Q1231009|Len|"Wheat Field with Cypresses"', result['qs'])
+        # The date is there, but without the circa qualifier
+        self.assertIn('Q1231009|P571|+1889-00-00T00:00:00Z/9|P1480|Q5727902', result['qs'])
+        self.assertIn('Q1231009|P195|Q67429134|P217|"1993.132"', result['qs'])
+
+        # From the index, values are known but not their qualifiers
+        result = transform_object(436535, met, lookup=lookup, matches={'Q1231009': {'P31': ['Q3305213']}})
+        self.assertNotIn('Q1231009|P31|Q3305213', result['qs'])
+        # ... and labels, descriptions and the Met ID it was matched by are not overwritten or repeated
+        self.assertFalse([line for line in result['qs'] if line.split('|')[1] in ('Len', 'Den', 'P3634')])
+        self.assertIn('Q1231009|P195|Q67429134|P217|"1993.132"', result['qs'])
@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase, mock
+
+import crosswalk
+
+crosswalk_wikitext = '''\
+{| class="wikitable sortable"
+! Object Name !! QID !! extrastatement !! extraqualifier
+|-
+| Painting || Q3305213 || ||
+|-
+| Bust || Q241045 || Q860861 ||
+|-
+| Vase || || ||
+|}
+'''
+
+
+def fake_api(revid):
+    def _get(api_url, params=None, **kwargs):
+        revision = {'revid': revid}
+        if 'content' in params['rvprop']:
+            revision['*'] = crosswalk_wikitext
+        response = mock.Mock()
+        response.json.return_value = {'query': {'pages': {'1': {'title': params['titles'],
+                                                                'revisions': [revision]}}}}
+        return response
+
+    return mock.Mock(side_effect=_get)
+
+
+class TestCrosswalkCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.tmpdir.name, 'crosswalk.pickle')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_rebuilds_only_on_new_revision(self):
+        cache = crosswalk.CrosswalkCache('api', 'page', snapshot_path=self.snapshot, ttl=0)
+        get = fake_api(100)
+        with mock.patch('httpclient.get', get):
+            df = cache.get()
+            self.assertEqual(list(df['QID'][:2]), ['Q3305213', 'Q241045'])
+            cache.get()
+        content_calls = [c for c in get.call_args_list if 'content' in c.kwargs['params']['rvprop']]
+        self.assertEqual(len(content_calls), 1)
+
+        with mock.patch('httpclient.get', fake_api(101)):
+            cache.get()
+        self.assertEqual(cache.revid, 101)
+
+    def test_snapshot_warms_new_cache(self):
+        with mock.patch('httpclient.get', fake_api(100)):
+            crosswalk.CrosswalkCache('api', 'page', snapshot_path=self.snapshot).get()
+
+        get = fake_api(100)
+        with mock.patch('httpclient.get', get):
+            df = crosswalk.CrosswalkCache('api', 'page', snapshot_path=self.snapshot).get()
+        get.assert_not_called()
+        self.assertEqual(df['extrastatement'][1], 'Q860861')
+        self.assertTrue(df['QID'].isna()[2])
+
+    def test_pywikibot_source(self):
+        page = mock.Mock(text=crosswalk_wikitext, latest_revision_id=7)
+        page.title.return_value = 'page'
+        pywikibot = mock.Mock(Page=mock.Mock(return_value=page))
+        with mock.patch.dict(sys.modules, pywikibot=pywikibot):
+            cache = crosswalk.CrosswalkCache(crosswalk.PywikibotSource(site='wikidata'), 'page')
+            self.assertEqual(cache.get_lookup().get('Bust').qid, 'Q241045')
+        pywikibot.Page.assert_called_with('wikidata', 'page')
+        self.assertEqual(cache.revid, 7)
+
+
+class TestParseCrosswalk(TestCase):
+    def test_line_parser_matches_wikitables(self):
+        wikitext = '''\
+{| class="wikitable"
+|+ Crosswalk
+! Object Name
+! QID
+|-
+| [[Q3305213|Painting]] || style="color: red" | Q3305213
+|-
+| \'\'\'Vase\'\'\' || [[Q191851]]
+|-
+|  ||
+|}
+'''
+        table = crosswalk._parse_simple_table(wikitext)
+        self.assertEqual(table, {'columns': ['Object Name', 'QID'],
+                                 'data': [['Painting', 'Q3305213'], ['Vase', 'Q191851']]})
+        self.assertEqual(table, crosswalk._parse_full_table(wikitext, 'page'))
+        self.assertEqual(crosswalk.parse_crosswalk(crosswalk_wikitext)['data'][2], ['Vase', None, None, None])
+
+    def test_templates_go_through_wikitables(self):
+        wikitext = '{| class="wikitable"\n! Object Name !! QID\n|-\n| Bust || {{Q|241045}}\n|}\n'
+        with mock.patch('crosswalk._parse_full_table', return_value='parsed') as full:
+            self.assertEqual(crosswalk.parse_crosswalk(wikitext, 'page'), 'parsed')
+        full.assert_called_once_with(wikitext, 'page')
+
+
+class TestCrosswalkLookup(TestCase):
+    def test_exact_and_normalized_resolution(self):
+        lookup = crosswalk.CrosswalkLookup([('Painting', 'Q3305213', None, None),
+                                            ('Bust', 'Q241045', 'Q860861', ''),
+                                            ('Bust', 'Q999', None, None)])
+        self.assertEqual(lookup.resolve('Bust'), (('Q241045', 'Q860861', None), True))
+        self.assertEqual(lookup.resolve(' painting '), (('Q3305213', None, None), False))
+        self.assertIsNone(lookup.get('Vase'))
+        self.assertIsNone(lookup.get(None))
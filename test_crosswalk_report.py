@@ -0,0 +1,42 @@
+import io
+from unittest import TestCase
+
+import crosswalk_report
+from crosswalk import CrosswalkLookup
+
+met_csv = '''\
+Object ID,Object Name,Classification
+1,Painting,Paintings
+2,Print,Prints
+3,Print,Prints
+4,Print,Photographs
+5,vase ,Ceramics
+6,Vase,Ceramics
+7,Fan|Screen,Textiles
+8,,
+'''
+
+lookup = CrosswalkLookup([('Painting', 'Q3305213', None, None),
+                          ('Vase', None, None, None)])
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.table = crosswalk_report.coverage_table(crosswalk_report.read_counts(io.StringIO(met_csv)), lookup)
+
+    def test_coverage_table(self):
+        rows = {row[0]: (row.objects, row.status) for row in self.table.itertuples(index=False)}
+        self.assertEqual(rows, {'Print': (3, 'missing'), 'Vase': (1, 'no QID'), 'vase ': (1, 'no QID'),
+                                'Painting': (1, 'mapped'), 'Fan|Screen': (1, 'missing'), '': (1, 'missing')})
+        self.assertEqual(self.table['classifications'][0], 'Prints (2), Photographs (1)')
+
+    def test_wikitable(self):
+        gaps = crosswalk_report.gaps(self.table, limit=2)
+        self.assertEqual(list(gaps['Object Name']), ['Print', 'Fan|Screen'])
+        self.assertEqual(list(gaps['cumulative']), [0.375, 0.5])
+        wikitable = crosswalk_report.to_wikitable(crosswalk_report.gaps(self.table),
+                                                  crosswalk_report.summary(self.table))
+        self.assertIn('| 1 || Print || 3 || 37.50% || 37.50% || missing || Prints (2), Photographs (1)', wikitable)
+        self.assertIn('|| Fan&#124;Screen ||', wikitable)
+        self.assertTrue(wikitable.startswith('8 objects with 5 distinct objectNames; 12.5% of objects'))
+        self.assertTrue(wikitable.endswith('|}\n'))
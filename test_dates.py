@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+from dates import parse_dates, parse_object_date
+
+
+class TestParseObjectDate(TestCase):
+    def check(self, text, value, *qualifiers):
+        parsed = parse_object_date(text)
+        self.assertIsNotNone(parsed, text)
+        self.assertEqual((parsed.value, parsed.qualifiers), (value, qualifiers))
+
+    def test_years(self):
+        self.check('1889', '+1889-00-00T00:00:00Z/9')
+        self.check('ca. 1882', '+1882-00-00T00:00:00Z/9', ('P1480', 'Q5727902'))
+        self.check('A.D. 100', '+0100-00-00T00:00:00Z/9')
+        self.check('500 B.C.', '-0500-00-00T00:00:00Z/9')
+
+    def test_questioned(self):
+        for text in ('1615?', '1615 ?'):
+            self.check(text, '+1615-00-00T00:00:00Z/9', ('P1480', 'Q5727902'))
+            self.assertEqual(parse_object_date(text).kind, 'circa')
+        self.check('1880s?', '+1880-00-00T00:00:00Z/8', ('P1480', 'Q5727902'))
+
+    def test_ranges(self):
+        self.check('ca. 1882–89', '+1880-00-00T00:00:00Z/8', ('P1480', 'Q5727902'),
+                   ('P1319', '+1882-00-00T00:00:00Z/9'), ('P1326', '+1889-00-00T00:00:00Z/9'))
+        self.check('1750-1800', '+1750-00-00T00:00:00Z/7',
+                   ('P1319', '+1750-00-00T00:00:00Z/9'), ('P1326', '+1800-00-00T00:00:00Z/9'))
+        self.check('ca. 1390–52 B.C.', '-1350-00-00T00:00:00Z/7', ('P1480', 'Q5727902'),
+                   ('P1319', '-1390-00-00T00:00:00Z/9'), ('P1326', '-1352-00-00T00:00:00Z/9'))
+        self.check('ca. 1800–1850', '+1850-00-00T00:00:00Z/7', ('P1480', 'Q5727902'),
+                   ('P1319', '+1800-00-00T00:00:00Z/9'), ('P1326', '+1850-00-00T00:00:00Z/9'))
+        self.check('1700-1799', '+1750-00-00T00:00:00Z/7',
+                   ('P1319', '+1700-00-00T00:00:00Z/9'), ('P1326', '+1799-00-00T00:00:00Z/9'))
+        self.check('1650-1800', '+1500-00-00T00:00:00Z/6',
+                   ('P1319', '+1650-00-00T00:00:00Z/9'), ('P1326', '+1800-00-00T00:00:00Z/9'))
+        self.check('100 B.C.–A.D. 5', 'somevalue',
+                   ('P1319', '-0100-00-00T00:00:00Z/9'), ('P1326', '+0005-00-00T00:00:00Z/9'))
+        self.assertIsNone(parse_object_date('1900–1850'))
+
+    def test_decades_and_centuries(self):
+        self.check('1880s', '+1880-00-00T00:00:00Z/8')
+        self.check('19th century', '+1850-00-00T00:00:00Z/7')
+        self.check('3rd century B.C.', '-0250-00-00T00:00:00Z/7')
+        self.check('late 19th century', '+1850-00-00T00:00:00Z/7',
+                   ('P1319', '+1867-00-00T00:00:00Z/9'), ('P1326', '+1900-00-00T00:00:00Z/9'))
+        self.check('12th–11th century B.C.', '-1500-00-00T00:00:00Z/6',
+                   ('P1319', '-1200-00-00T00:00:00Z/9'), ('P1326', '-1001-00-00T00:00:00Z/9'))
+
+    def test_before_after_and_dynasties(self):
+        self.check('before 1900', 'somevalue', ('P1326', '+1900-00-00T00:00:00Z/9'))
+        self.check('after 1750', 'somevalue', ('P1319', '+1750-00-00T00:00:00Z/9'))
+        self.check('Dynasty 12, reign of Senwosret I', '-1500-00-00T00:00:00Z/6', ('P1480', 'Q5727902'),
+                   ('P1319', '-1981-00-00T00:00:00Z/9'), ('P1326', '-1802-00-00T00:00:00Z/9'))
+
+    def test_unparsed(self):
+        for text in ('', 'n.d.', 'late 2nd–early 1st century B.C.', None):
+            self.assertIsNone(parse_object_date(text))
+
+    def test_parse_dates(self):
+        parsed = parse_dates(['1889', None, 'n.d.', '1880s', '1889'])
+        self.assertEqual(list(parsed['kind'].fillna('')), ['year', '', '', 'decade', 'year'])
+        self.assertEqual(parsed['value'][4], '+1889-00-00T00:00:00Z/9')
@@ -0,0 +1,30 @@
+from unittest import TestCase, mock
+
+import httpclient
+
+
+def response(status, headers=None):
+    return mock.Mock(status_code=status, headers=headers or {})
+
+
+class TestHttpClient(TestCase):
+    def test_retries_honour_retry_after(self):
+        client = httpclient.HttpClient(retries=2, rate_limits={'example.org': {'rate': 100, 'burst': 1}})
+        request = mock.Mock(side_effect=[response(429, {'Retry-After': '0.05'}), response(200)])
+        with mock.patch.object(client.session, 'request', request):
+            self.assertEqual(client.get('https://example.org/x').status_code, 200)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(request.call_args.kwargs['timeout'], 20)
+
+    def test_gives_up_after_retries(self):
+        client = httpclient.HttpClient(retries=1, backoff=0)
+        with mock.patch.object(client.session, 'request', return_value=response(503)) as request:
+            self.assertEqual(client.get('https://example.org/x').status_code, 503)
+        self.assertEqual(request.call_count, 2)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = httpclient.TokenBucket(rate=1000, burst=2)
+        with mock.patch('httpclient.time.sleep') as sleep:
+            for i in range(3):
+                bucket.acquire()
+        sleep.assert_called()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+import batch
+import jobs
+
+
+def process(id):
+    if id == 3:
+        raise ValueError('boom')
+    return {'id': id, 'qs': ['CREATE', 'LAST|P3634|"{}"'.format(id)], 'memo': [], 'data': {'objectID': id}}
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = jobs.JobStore(os.path.join(self.tmpdir.name, 'jobs.sqlite3'))
+        self.calls = []
+        self.runner = jobs.JobRunner(self.store, self.record, os.path.join(self.tmpdir.name, 'out'), workers=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def record(self, id):
+        self.calls.append(id)
+        return process(id)
+
+    def test_run_job(self):
+        id = self.store.create({'range': [1, 5]})
+        self.runner.run_job(id)
+        job = self.store.get(id)
+        self.assertEqual((job['status'], job['total'], job['processed'], job['failed']), ('done', 5, 4, 1))
+        self.assertEqual(self.store.errors(id), [{'id': 3, 'error': 'ValueError: boom'}])
+        with open(self.runner.output_path(id, 'qs')) as f:
+            self.assertEqual(f.read().count('CREATE'), 4)
+        status = jobs.job_status(job, [], lambda id, name: name)
+        self.assertEqual(status['progress'], 0.8)
+        self.assertEqual(status['output']['memo'], 'memo')
+
+    def test_resume_after_restart(self):
+        id = self.store.create({'ids': [1, 2, 4, 5]})
+        # The app stopped after the first two objects were written
+        output = batch.BatchOutput(self.runner.output_prefix(id))
+        output.write(process(1))
+        output.write(process(2))
+        output.close()
+        self.store.start(id, 4, 0)
+
+        self.assertEqual(self.store.claimable(120), [id])
+        self.runner.run_job(id)
+        self.assertEqual(sorted(self.calls), [4, 5])
+        self.assertEqual(self.store.get(id)['processed'], 4)
+        self.assertEqual(self.store.claimable(120), [])
+
+    def test_claim(self):
+        first = self.store.create({'range': [1, 2]})
+        second = self.store.create({'range': [3, 4]})
+        self.assertEqual(self.store.claim('a', 120), first)
+        # Another process only gets the next job, and cannot run the one claimed by the first
+        other = jobs.JobRunner(self.store, self.record, self.runner.directory)
+        self.assertEqual(self.store.claim('b', 120), second)
+        self.assertIsNone(self.store.claim('c', 120))
+        other.run_job(first)
+        self.assertEqual((self.store.get(first)['status'], self.calls), ('running', []))
+
+        # Once the first runner's heartbeat is stale, its job is taken over
+        self.assertTrue(self.store.heartbeat(first, 'a'))
+        self.assertEqual(self.store.claim('c', -1, first), first)
+        self.assertFalse(self.store.heartbeat(first, 'a'))
+
+    def test_runner_survives_a_broken_job(self):
+        broken = self.store.create({'range': [1, 2]})
+        ok = self.store.create({'range': [4, 5]})
+        resolve_ids = jobs.resolve_ids
+
+        def resolve_or_break(source):
+            if source['range'][0] == 1:
+                raise KeyError(0)
+            return resolve_ids(source)
+
+        with mock.patch('jobs.resolve_ids', side_effect=resolve_or_break):
+            self.runner.start()
+            for _ in range(100):
+                if self.store.get(ok)['status'] == 'done':
+                    break
+                time.sleep(0.05)
+        self.assertEqual((self.store.get(broken)['status'], self.store.get(broken)['message']),
+                         ('failed', 'KeyError: 0'))
+        self.assertEqual(self.store.get(ok)['status'], 'done')
+
+    def test_cancel(self):
+        queued = self.store.create({'range': [1, 2]})
+        self.assertTrue(self.store.request_cancel(queued))
+        self.assertEqual(self.store.get(queued)['status'], 'cancelled')
+
+        running = self.store.create({'range': [1, 100]})
+        self.store.start(running, 100, 0)
+        self.assertTrue(self.store.request_cancel(running))
+        self.runner.run_job(running)
+        self.assertEqual(self.store.get(running)['status'], 'cancelled')
+        self.assertEqual(self.calls, [])
+        self.assertFalse(self.store.request_cancel(running))
+
+    def test_validate_source(self):
+        self.assertEqual(jobs.validate_source({'department': ' Egyptian Art '}, 10), {'department': 'Egyptian Art'})
+        for source in [None, {}, {'range': [5, 1]}, {'range': [1, 20]}, {'ids': ['1']}, {'range': [1], 'ids': [1]}]:
+            with self.assertRaises(ValueError):
+                jobs.validate_source(source, 10)
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from metcache import MetCache
+
+
+def response(status, data=None, headers=None):
+    r = mock.Mock(status_code=status, headers=headers or {})
+    r.json.return_value = data
+    return r
+
+
+class TestMetCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'metcache.sqlite3')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fresh_hit_and_conditional_revalidation(self):
+        cache = MetCache(self.path, ttl=60)
+        get = mock.Mock(return_value=response(200, {'objectID': 1}, {'ETag': '"abc"'}))
+        with mock.patch('httpclient.get', get):
+            self.assertEqual(cache.get(1), {'objectID': 1})
+            self.assertEqual(cache.get(1), {'objectID': 1})
+        self.assertEqual(get.call_count, 1)
+
+        cache.ttl = 0
+        get = mock.Mock(return_value=response(304))
+        with mock.patch('httpclient.get', get):
+            self.assertEqual(cache.get(1), {'objectID': 1})
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"abc"'})
+
+    def test_negative_caching(self):
+        cache = MetCache(self.path, negative_ttl=60)
+        get = mock.Mock(return_value=response(404, {'message': 'ObjectID not found'}))
+        with mock.patch('httpclient.get', get):
+            cache.get(2)
+            self.assertEqual(cache.get(2), {'message': 'ObjectID not found'})
+        self.assertEqual(get.call_count, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = MetCache(self.path, max_bytes=1)
+        with mock.patch('httpclient.get', return_value=response(200, {'objectID': 3})):
+            cache.get(3)
+        self.assertEqual(cache.size(), 0)
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+
+import batch
+import metcsv
+from crosswalk import CrosswalkLookup
+from metindex import MetIndex
+
+met_csv = '''\
+Object Number,Is Highlight,Is Timeline Work,Is Public Domain,Object ID,Department,Object Name,Title,Culture,\
+Artist Display Name,Object Date,Medium,Dimensions,Credit Line,Classification,Link Resource,Object Wikidata URL,\
+Metadata Date,Tags
+1993.132,True,True,True,436535,European Paintings,Painting,Wheat Field with Cypresses,,\
+Vincent van Gogh|Someone Else,1889,Oil on canvas,73.2 × 93.4 cm,"Purchase, 1993",Paintings,\
+http://www.metmuseum.org/art/collection/search/436535,https://www.wikidata.org/wiki/Q1231009,2/7/2023 4:46:51 AM,
+29.100.5,False,False,False,10,The American Wing,Bust,"Bust, of someone",American,,ca. 1850,Marble,,Gift,Sculpture,\
+http://www.metmuseum.org/art/collection/search/10,,2/7/2023 4:46:51 AM,Men
+'''
+
+
+class TestMetCsv(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, 'MetObjects.csv')
+        with open(self.csv_path, 'w', encoding='utf-8') as f:
+            f.write(met_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_rows_map_to_api_fields(self):
+        objects = list(metcsv.read_objects(self.csv_path, chunksize=1))
+        self.assertEqual(objects[0]['objectID'], 436535)
+        self.assertIs(objects[0]['isPublicDomain'], True)
+        self.assertEqual(objects[0]['artistDisplayName'], 'Vincent van Gogh')
+        self.assertEqual(objects[1]['title'], 'Bust, of someone')
+        self.assertEqual(objects[1]['artistDisplayName'], '')
+        self.assertNotIn('tags', objects[1])
+
+    def test_run_csv_through_transform(self):
+        index = MetIndex(os.path.join(self.tmpdir.name, 'metindex.sqlite3'))
+        response = mock.Mock()
+        response.json.return_value = {'results': {'bindings': []}}
+        with mock.patch('httpclient.post', return_value=response):
+            index.sweep()
+        index.store(10, [{'item': {'value': 'http://www.wikidata.org/entity/Q42'}, 'metid': {'value': '10'}}])
+
+        out = os.path.join(self.tmpdir.name, 'run')
+        lookup = CrosswalkLookup([('Painting', 'Q3305213', None, None), ('Bust', 'Q241045', None, None)])
+        self.assertEqual(batch.run_csv(self.csv_path, out, lookup, index, chunksize=1), (2, 0))
+        with open(out + '.qs.txt') as f:
+            qs = f.read().splitlines()
+        self.assertIn('LAST|P31|Q3305213', qs)
+        self.assertIn('Q42|P31|Q241045', qs)
+        with open(out + '.memo.jsonl') as f:
+            self.assertEqual([m['qs_subject'] for m in map(json.loads, f)], ['LAST', 'Q42'])
+
+        # The reconciliation service failing only leaves out the creators
+        reconciler = mock.Mock()
+        reconciler.reconcile_many.side_effect = requests.ConnectionError('down')
+        out = os.path.join(self.tmpdir.name, 'run2')
+        self.assertEqual(batch.run_csv(self.csv_path, out, lookup, index, reconciler, chunksize=1), (2, 0))
+        with open(out + '.qs.txt') as f:
+            self.assertNotIn('P170', f.read())
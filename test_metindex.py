@@ -0,0 +1,50 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import metindex
+
+
+def binding(item, metid, **values):
+    row = {'item': {'value': 'http://www.wikidata.org/entity/' + item}, 'metid': {'value': metid}}
+    for var, value in values.items():
+        row[var] = {'value': value}
+    return row
+
+
+def fake_sparql(*pages):
+    responses = []
+    for bindings in pages:
+        response = mock.Mock()
+        response.json.return_value = {'results': {'bindings': bindings}}
+        responses.append(response)
+    return mock.Mock(side_effect=responses)
+
+
+class TestMetIndex(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = metindex.MetIndex(os.path.join(self.tmpdir.name, 'metindex.sqlite3'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sweep_pages_and_finds_duplicates(self):
+        pages = [[binding('Q1', '10', instances='http://www.wikidata.org/entity/Q3305213|'
+                                                'http://www.wikidata.org/entity/Q860861', inventorys='29.100.5'),
+                  binding('Q2', '11')],
+                 [binding('Q3', '11')]]
+        with mock.patch('httpclient.post', fake_sparql(*pages)), mock.patch('metindex.time.sleep'):
+            self.index.sweep(page_size=2)
+        self.assertTrue(self.index.is_built())
+        self.assertEqual(self.index.lookup(10)['Q1']['P31'], ['Q3305213', 'Q860861'])
+        self.assertEqual(self.index.lookup(10)['Q1']['P217'], ['29.100.5'])
+        self.assertEqual(self.index.duplicates(), [('11', 'Q2,Q3')])
+        self.assertEqual(self.index.lookup(12), {})
+
+    def test_refresh_replaces_rows_for_requested_ids(self):
+        self.index.store(10, [binding('Q1', '10'), binding('Q9', '10')])
+        with mock.patch('httpclient.post', fake_sparql([binding('Q1', '10', locations='Q160236')])):
+            self.index.refresh([10])
+        self.assertEqual(list(self.index.lookup(10)), ['Q1'])
+        self.assertEqual(self.index.lookup(10)['Q1']['P276'], ['Q160236'])
@@ -0,0 +1,45 @@
+from unittest import TestCase, mock
+
+import httpclient
+import metrics
+
+
+class TestMetrics(TestCase):
+    def test_render_prometheus_text(self):
+        registry = metrics.Registry(buckets=(0.1, 1))
+        registry.inc('http_requests_total', host='example.org', status=200)
+        registry.inc('http_requests_total', host='example.org', status=200)
+        registry.observe('stage_seconds', 0.5, stage='sparql')
+        text = registry.render()
+        self.assertIn('# TYPE glamingest_http_requests_total counter', text)
+        self.assertIn('glamingest_http_requests_total{host="example.org",status="200"} 2', text)
+        self.assertIn('glamingest_stage_seconds_bucket{stage="sparql",le="0.1"} 0', text)
+        self.assertIn('glamingest_stage_seconds_bucket{stage="sparql",le="1"} 1', text)
+        self.assertIn('glamingest_stage_seconds_count{stage="sparql"} 1', text)
+
+        # Retries of one host by status code and by exception name
+        registry.inc('http_retries_total', host='example.org', reason=503)
+        registry.inc('http_retries_total', host='example.org', reason='ConnectionError')
+        text = registry.render()
+        self.assertIn('glamingest_http_retries_total{host="example.org",reason="503"} 1', text)
+        self.assertIn('glamingest_http_retries_total{host="example.org",reason="ConnectionError"} 1', text)
+        self.assertEqual(registry.counter('http_retries_total', host='example.org', reason=503), 1)
+
+    def test_timings(self):
+        registry = metrics.Registry()
+        timings = metrics.Timings(registry)
+        timings.add('sparql', 0.25)
+        self.assertEqual(timings.wrap('transform', lambda x: x + 1)(1), 2)
+        self.assertTrue(timings.server_timing().startswith('sparql;dur=250.0, transform;dur='))
+        self.assertIn('glamingest_stage_seconds_count{stage="transform"} 1', registry.render())
+
+    def test_http_statuses_and_retries_are_counted(self):
+        client = httpclient.HttpClient(retries=1, backoff=0)
+        statuses = [mock.Mock(status_code=503, headers={}), mock.Mock(status_code=200, headers={})]
+        with mock.patch.object(client.session, 'request', side_effect=statuses), \
+                mock.patch('metrics.registry', metrics.Registry()):
+            client.get('https://metrics.example.org/x')
+            self.assertEqual(metrics.registry.counter('http_requests_total', host='metrics.example.org',
+                                                      status=503), 1)
+            self.assertEqual(metrics.registry.counter('http_retries_total', host='metrics.example.org',
+                                                      reason=503), 1)
@@ -0,0 +1,61 @@
+import time
+from unittest import TestCase, mock
+
+import pagecache
+
+
+class Test(TestCase):
+    def test_key_and_budget(self):
+        cache = pagecache.PageCache(max_bytes=10)
+        key = pagecache.page_key({'metadataDate': '2024-01-01T00:00:00Z'}, 1, {'Q1': {'P31': ['Q3305213']}})
+        cache.put(1, key, b'aaaa')
+        self.assertEqual(cache.get(1, key).etag, pagecache.etag(b'aaaa'))
+        self.assertIsNone(cache.get(1, key._replace(revid=2)))
+        self.assertNotIn(1, cache)
+
+        cache.put(1, key, b'aaaa')
+        cache.put(2, key, b'bbbb')
+        cache.get(1, key)
+        cache.put(3, key, b'cccc')
+        # The least recently viewed page made way
+        self.assertEqual((sorted(cache._pages), cache.size), ([1, 3], 8))
+        cache.put(4, key, b'x' * 11)
+        self.assertNotIn(4, cache)
+
+    def test_unmatched_expire_sooner(self):
+        cache = pagecache.PageCache(ttl=3600, unmatched_ttl=60)
+        unmatched = pagecache.page_key({}, 1, {})
+        matched = pagecache.page_key({}, 1, {'Q1': {}})
+        self.assertEqual(unmatched.match, 'unmatched')
+        cache.put(1, unmatched, b'page')
+        cache.put(2, matched, b'page')
+        later = time.time() + 120
+        with mock.patch('pagecache.time.time', return_value=later):
+            self.assertIsNone(cache.get(1, unmatched))
+            self.assertIsNotNone(cache.get(2, matched))
+
+    def test_item_revisions(self):
+        calls = []
+
+        def fetch(qids):
+            calls.append(qids)
+            if len(calls) > 2:
+                raise ConnectionError('down')
+            return {qid: len(calls) for qid in qids}
+
+        revisions = pagecache.RevisionCache(fetch, ttl=3600)
+        self.assertEqual(revisions.get_many(['Q1']), {'Q1': 1})
+        self.assertEqual(revisions.get_many(['Q1', 'Q2']), {'Q1': 1, 'Q2': 2})
+        self.assertEqual(calls, [['Q1'], ['Q2']])
+        # Known revisions stand in for a failed check, but an item never seen cannot be answered for
+        revisions.ttl = 0
+        self.assertEqual(revisions.get_many(['Q1']), {'Q1': 1})
+        with self.assertRaises(ConnectionError):
+            revisions.get_many(['Q3'])
+
+        # A page is still served when the revisions cannot be checked at all
+        cache = pagecache.PageCache()
+        key = pagecache.page_key({}, 1, {'Q3': {}}, {'Q3': 7})
+        cache.put(1, key, b'page')
+        self.assertIsNotNone(cache.get(1, pagecache.page_key({}, 1, {'Q3': {}}, None)))
+        self.assertIsNone(cache.get(1, pagecache.page_key({}, 1, {'Q3': {}}, {'Q3': 8})))
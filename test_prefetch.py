@@ -0,0 +1,49 @@
+import threading
+from concurrent import futures
+from unittest import TestCase
+
+from prefetch import Prefetcher
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.prefetcher = Prefetcher(self.process, workers=1, max_pending=3)
+
+    def tearDown(self):
+        self.release.set()
+        self.prefetcher.shutdown()
+
+    def process(self, id):
+        self.calls.append(id)
+        self.release.wait(5)
+        return {'id': id}
+
+    def test_get_waits_for_prefetch_in_flight(self):
+        self.prefetcher.prefetch([1])
+        threading.Timer(0.05, self.release.set).start()
+        self.assertEqual(self.prefetcher.get(1), ({'id': 1}, True))
+        # A prefetched result is only served once
+        self.assertEqual(self.prefetcher.get(1), ({'id': 1}, False))
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_queue_is_bounded(self):
+        # 1 is running and 2, 3 are queued; 4 takes the place of a queued ID that is not wanted any more
+        self.prefetcher.prefetch([1, 2, 3])
+        self.prefetcher.prefetch([1, 3, 4])
+        self.assertEqual(list(self.prefetcher._pending), [1, 3, 4])
+        self.release.set()
+        futures.wait(list(self.prefetcher._pending.values()))
+        self.assertEqual(self.prefetcher.get(4), ({'id': 4}, True))
+        self.assertNotIn(2, self.calls)
+
+    def test_get_takes_over_queued_prefetch(self):
+        # 1 is running, so 2 is still queued when it is viewed, and is processed inline instead
+        self.prefetcher.prefetch([1, 2])
+        threading.Timer(0.05, self.release.set).start()
+        self.assertEqual(self.prefetcher.get(2), ({'id': 2}, False))
+        self.assertNotIn(2, self.prefetcher._pending)
+        self.prefetcher.prefetch([2])
+        futures.wait([self.prefetcher._pending[2]])
+        self.assertEqual(self.prefetcher.get(2), ({'id': 2}, True))
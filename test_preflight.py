@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+
+import preflight
+
+image = b'\xff\xd8' + b'pixels' * 50000
+
+
+def fake_response(status=200, headers=None, body=b''):
+    response = mock.MagicMock(status_code=status, headers=headers or {})
+    response.iter_content.side_effect = lambda size: (body[i:i + size] for i in range(0, len(body), size))
+    response.__enter__.return_value = response
+    return response
+
+
+def fake_server(files):
+    def head(url, **kwargs):
+        if url not in files:
+            return fake_response(404)
+        return fake_response(headers={'Content-Type': 'image/jpeg', 'Content-Length': str(len(files[url]))})
+
+    def get(url, **kwargs):
+        if url == 'http://img/truncated.jpg':
+            return fake_response(headers={'Content-Type': 'image/jpeg'}, body=image[:100])
+        return fake_response(headers={'Content-Type': 'image/jpeg'}, body=files[url])
+
+    return mock.patch.multiple('httpclient', head=mock.Mock(side_effect=head), get=mock.Mock(side_effect=get))
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = preflight.Sha1Index(os.path.join(self.tmpdir.name, 'sha1.sqlite3'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_index_load_dump(self):
+        dump = os.path.join(self.tmpdir.name, 'dump.tsv')
+        with open(dump, 'w') as f:
+            f.write('img_sha1\timg_name\n'
+                    'phoiac9h4m842xq45sp7s6u21eteeq1\tEmpty.txt\n'
+                    'A9993E364706816ABA3E25717850C26C9CD0D89D\tAbc.jpg\n')
+        self.assertEqual(self.index.load_dump(dump), 2)
+        # SHA-1 of b'' in MediaWiki's base 36
+        self.assertEqual(self.index.lookup(hashlib.sha1(b'').hexdigest()), 'Empty.txt')
+        self.assertEqual(self.index.lookup(hashlib.sha1(b'abc').hexdigest()), 'Abc.jpg')
+        self.assertIsNone(self.index.lookup(hashlib.sha1(b'other').hexdigest()))
+
+    def test_preflight(self):
+        files = {'http://img/new.jpg': image, 'http://img/copy.jpg': image, 'http://img/commons.jpg': b'on commons',
+                 'http://img/truncated.jpg': image}
+        self.index.load([(hashlib.sha1(b'on commons').hexdigest(), 'Existing.jpg')])
+        entries = [{'id': 1, 'url': 'http://img/new.jpg', 'filename': 'New.jpg'},
+                   {'id': 2, 'url': 'http://img/commons.jpg', 'filename': 'Other.jpg'},
+                   {'id': 3, 'url': 'http://img/missing.jpg', 'filename': 'Missing.jpg'},
+                   {'id': 4, 'url': 'http://img/truncated.jpg', 'filename': 'Truncated.jpg'}]
+        with fake_server(files):
+            checked = {entry['id']: entry['preflight'] for entry in preflight.preflight(entries, self.index, workers=2)}
+            # The same image again within a run is a duplicate of the first
+            again = list(preflight.preflight(entries[:1] + [{'id': 5, 'url': 'http://img/copy.jpg'}], workers=1))
+        self.assertEqual(checked[1]['status'], 'upload')
+        self.assertEqual((checked[1]['sha1'], checked[1]['content_length']),
+                         (hashlib.sha1(image).hexdigest(), len(image)))
+        self.assertEqual((checked[2]['status'], checked[2]['duplicate_of']), ('duplicate', 'Existing.jpg'))
+        self.assertEqual((checked[3]['status'], checked[3]['error']), ('broken', 'HTTP 404'))
+        self.assertEqual(checked[4]['error'], 'truncated: 100 of {} bytes'.format(len(image)))
+        self.assertEqual(again[1]['preflight']['duplicate_of'], 'New.jpg')
+
+    def test_connection_error_is_broken(self):
+        with mock.patch('httpclient.head', side_effect=requests.ConnectionError('refused')):
+            check = preflight.check_image('http://img/a.jpg')
+        self.assertEqual((check.status, check.error), ('broken', 'ConnectionError: refused'))
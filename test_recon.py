@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from recon import ReconCache, Reconciler, best_match
+
+known_artists = {
+    'Vincent van Gogh': [{'id': 'Q5582', 'name': 'Vincent van Gogh', 'score': 100, 'match': True}],
+    'Claude Monet': [{'id': 'Q296', 'name': 'Claude Monet', 'score': 97, 'match': False},
+                     {'id': 'Q123', 'name': 'Claude Monet Jr', 'score': 60, 'match': False}],
+}
+
+
+# Stub of the reconciliation service, answering batched "queries" payloads
+class StubReconHandler(BaseHTTPRequestHandler):
+    batches = []
+    types = set()
+
+    def do_POST(self):
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        queries = json.loads(form['queries'][0])
+        self.batches.append(sorted(q['query'] for q in queries.values()))
+        self.types.update(q.get('type') for q in queries.values())
+        body = json.dumps({key: {'result': known_artists.get(q['query'], [])} for key, q in queries.items()})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRecon(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubReconHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        StubReconHandler.batches = []
+        StubReconHandler.types = set()
+        self.reconciler = Reconciler(ReconCache(os.path.join(self.tmpdir.name, 'recon.sqlite3')),
+                                     api_url='http://127.0.0.1:{}/en/api'.format(self.server.server_port),
+                                     batch_size=2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_batches_and_caches_names(self):
+        names = ['Vincent van Gogh', 'Claude Monet', 'Nobody', 'Vincent van Gogh']
+        results = self.reconciler.reconcile_many(names)
+        self.assertEqual(StubReconHandler.batches, [['Claude Monet', 'Nobody'], ['Vincent van Gogh']])
+        self.assertEqual(results['Nobody'], [])
+
+        self.assertEqual(self.reconciler.reconcile('Claude Monet')[0]['id'], 'Q296')
+        self.assertEqual(len(StubReconHandler.batches), 2)
+        self.assertEqual(StubReconHandler.types, {'Q5'})
+
+        # Candidates found without the human constraint are not reused for it, and the other way round
+        untyped = Reconciler(self.reconciler.cache, api_url=self.reconciler.api_url, type=None)
+        self.assertEqual(untyped.reconcile('Claude Monet')[0]['id'], 'Q296')
+        self.assertEqual(len(StubReconHandler.batches), 3)
+        self.assertEqual(StubReconHandler.types, {'Q5', None})
+
+    def test_concurrent_lookups_are_batched(self):
+        self.reconciler.coalesce_delay = 5
+        self.reconciler.batch_size = 3
+        names = ['Vincent van Gogh', 'Claude Monet', 'Nobody']
+        results = {}
+        threads = [threading.Thread(target=lambda name=name: results.update({name: self.reconciler.reconcile(name)}))
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        # Sent as soon as the batch was full, rather than after the delay
+        self.assertEqual(StubReconHandler.batches, [sorted(names)])
+        self.assertEqual(results['Claude Monet'][0]['id'], 'Q296')
+        self.assertEqual(results['Nobody'], [])
+        # Cached names do not wait for a batch
+        self.assertEqual(self.reconciler.reconcile('Vincent van Gogh')[0]['id'], 'Q5582')
+        self.assertEqual(len(StubReconHandler.batches), 1)
+
+    def test_best_match(self):
+        self.assertEqual(best_match(known_artists['Vincent van Gogh'])['id'], 'Q5582')
+        self.assertEqual(best_match(known_artists['Claude Monet'])['id'], 'Q296')
+        self.assertIsNone(best_match([{'id': 'Q1', 'score': 95}, {'id': 'Q2', 'score': 90}]))
+        self.assertIsNone(best_match([]))
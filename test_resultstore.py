@@ -0,0 +1,72 @@
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+import batch
+import resultstore
+from crosswalk import CrosswalkLookup
+from transform import transform_object
+
+lookup = CrosswalkLookup([('Painting', 'Q3305213', None, None)])
+
+
+def met_object(id, **fields):
+    data = {'objectID': id, 'isPublicDomain': True, 'department': 'European Paintings', 'objectName': 'Painting',
+            'title': 'Painting {}'.format(id), 'accessionNumber': '1900.{}'.format(id), 'objectDate': '1880'}
+    data.update(fields)
+    return data
+
+
+def process(id, **fields):
+    data = met_object(id, **fields)
+    matches = {'Q{}'.format(id): {}} if id == 2 else None
+    result = transform_object(id, data, lookup=lookup, matches=matches)
+    result['data'] = data
+    return result
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = resultstore.ResultStore(os.path.join(self.tmpdir.name, 'results.sqlite3'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_filters(self):
+        self.store.append([process(1), process(2), process(3, isPublicDomain=False),
+                           process(4, objectDate='around the time of the flood'),
+                           process(5, department='Arms and Armor'),
+                           {'id': 6, 'data': {'message': 'Not a valid object'}}])
+        ids = lambda **filters: [record['id'] for record in self.store.iter_records(**filters)]  # noqa: E731
+        self.assertEqual(ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(ids(status='new', public_domain=True, department='European Paintings', date='parsed'), [1])
+        self.assertEqual(ids(status='existing'), [2])
+        self.assertEqual(ids(date='complex'), [4])
+        self.assertEqual(ids(date='year', limit=2), [1, 2])
+        self.assertEqual(ids(memo='Skipping since it is complex'), [4])
+        self.assertEqual(self.store.count(found=False), 1)
+
+        # An object processed again is exported as it was last seen
+        self.store.append([process(1, isPublicDomain=False)], run='again')
+        self.assertEqual(ids(public_domain=True), [2, 4, 5])
+        record = next(self.store.iter_records(run='again'))
+        self.assertEqual((record['id'], record['status'], record['date_kind']), (1, 'new', 'year'))
+        self.assertIn('LAST|P31|Q3305213', record['qs'])
+
+    def test_export(self):
+        self.store.append([process(1), process(2), process(3, isPublicDomain=False)])
+        f = io.StringIO()
+        self.assertEqual(resultstore.export(self.store.iter_records(status='new'), f), 2)
+        self.assertEqual(f.getvalue().count('CREATE'), 2)
+        self.assertIn('LAST|P195|Q67429134|P217|"1900.3"', f.getvalue())
+        f = io.StringIO()
+        self.assertEqual(resultstore.export(self.store.iter_records(), f, 'csv'), 3)
+        self.assertTrue(f.getvalue().startswith(','.join(resultstore.columns)))
+
+    def test_batch_run(self):
+        out = os.path.join(self.tmpdir.name, 'run1')
+        self.assertEqual(batch.run([1, 2], out, process, workers=2, store=self.store), (2, 0))
+        self.assertEqual({(record['id'], record['run']) for record in self.store.iter_records()},
+                         {(1, 'run1'), (2, 'run1')})
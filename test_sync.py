@@ -0,0 +1,61 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import sync
+from transform import quickstatements, statement
+
+
+def changed_ids(*ids):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {'total': len(ids), 'objectIDs': list(ids)}
+    return response
+
+
+class TestSync(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = sync.SyncState(os.path.join(self.tmpdir.name, 'sync.sqlite3'))
+        self.title = 'Wheat Field'
+        self.missing_only = False
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def process(self, id):
+        result = {'id': id, 'data': {'objectID': id}, 'qid': 'Q1', 'qs_subject': 'Q1', 'create': False, 'memo': [],
+                  'statements': [statement('Len', '"{}"'.format(self.title)), statement('P31', 'Q3305213')],
+                  'missing_only': self.missing_only}
+        result['qs'] = quickstatements(result)
+        return result
+
+    def run_sync(self, out, *ids):
+        with mock.patch('httpclient.get', return_value=changed_ids(*ids)) as get:
+            counts = sync.sync(os.path.join(self.tmpdir.name, out), self.state, self.process,
+                               datetime.date(2024, 1, 1))
+        self.assertEqual(get.call_args.kwargs['params'], {'metadataDate': '2024-01-01'})
+        with open(os.path.join(self.tmpdir.name, out + '.qs.txt')) as f:
+            return counts, f.read().splitlines()
+
+    def test_only_changed_statements_are_emitted(self):
+        self.assertIsNone(self.state.high_water_mark())
+        counts, qs = self.run_sync('first', 436535)
+        self.assertEqual(counts, (1, 1, 0))
+        self.assertEqual(qs, ['Q1|Len|"Wheat Field"', 'Q1|P31|Q3305213'])
+        self.assertEqual(self.state.high_water_mark(), datetime.date.today())
+
+        self.title = 'Wheat Field with Cypresses'
+        counts, qs = self.run_sync('second', 436535)
+        self.assertEqual(qs, ['Q1|Len|"Wheat Field with Cypresses"'])
+
+        # Nothing changed since the last run
+        counts, qs = self.run_sync('third', 436535)
+        self.assertEqual(qs, [])
+
+    def test_statements_still_missing_are_emitted_again(self):
+        # Statements checked against the item: the first run's edits were never applied
+        self.missing_only = True
+        self.run_sync('first', 436535)
+        counts, qs = self.run_sync('second', 436535)
+        self.assertEqual(qs, ['Q1|Len|"Wheat Field"', 'Q1|P31|Q3305213'])
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from crosswalk import CrosswalkLookup
+from transform import commons_filename, render_commons_template, transform_object
+
+met_object = {
+    'objectID': 436535,
+    'isPublicDomain': True,
+    'primaryImage': 'https://images.metmuseum.org/CRDImages/ep/original/DT1567.jpg',
+    'primaryImageSmall': 'https://images.metmuseum.org/CRDImages/ep/web-large/DT1567.jpg',
+    'accessionNumber': '1993.132',
+    'department': 'European Paintings',
+    'objectName': 'Painting',
+    'title': 'Wheat Field with Cypresses',
+    'culture': '',
+    'artistDisplayName': 'Vincent van Gogh',
+    'objectDate': 'ca. 1882–89',
+    'medium': 'Oil on canvas',
+    'dimensions': '28 7/8 × 36 3/4 in. (73.2 × 93.4 cm)',
+    'creditLine': 'Purchase, The Annenberg Foundation Gift, 1993',
+    'objectURL': 'https://www.metmuseum.org/art/collection/search/436535',
+    'objectWikidata_URL': 'https://www.wikidata.org/wiki/Q1231009',
+    'isTimelineWork': True,
+}
+
+lookup = CrosswalkLookup([('Painting', 'Q3305213', None, None)])
+
+
+class TestTransform(TestCase):
+    def test_new_item(self):
+        result = transform_object(436535, met_object, lookup=lookup,
+                                  artist_candidates=[{'id': 'Q5582', 'name': 'Vincent van Gogh', 'score': 100,
+                                                      'match': True}])
+        self.assertEqual(result['qs'][0], 'CREATE')
+        self.assertIn('LAST|P571|+1880-00-00T00:00:00Z/8|P1480|Q5727902|P1319|+1882-00-00T00:00:00Z/9|'
+                      'P1326|+1889-00-00T00:00:00Z/9', result['qs'])
+        self.assertIn('LAST|P195|Q67429134|P217|"1993.132"', result['qs'])
+        self.assertIn('LAST|Den|"painting by Vincent van Gogh (MET, 1993.132)"', result['qs'])
+        self.assertIn('LAST|P31|Q3305213', result['qs'])
+        self.assertIn('LAST|P170|Q5582', result['qs'])
+        self.assertIn('[[Category:Department of European Paintings', result['commons_template'])
+        self.assertIn('|wikidata           = Q1231009', result['commons_template'])
+
+    def test_existing_and_unchecked_subjects(self):
+        result = transform_object(436535, met_object, lookup=lookup, matches={'Q1231009': {}})
+        self.assertEqual(result['qs_subject'], 'Q1231009')
+        self.assertNotIn('CREATE', result['qs'])
+        result = transform_object(436535, met_object, lookup=lookup, matches={'Q1': {}, 'Q2': {}})
+        self.assertEqual(result['qs_subject'], 'TOOMANY')
+        result = transform_object(436535, met_object, lookup=None, checked=False)
+        self.assertEqual(result['qs_subject'], 'UNCHECKED')
+        self.assertIn('Object name: Skipped, crosswalk database unavailable', result['memo'])
+
+    def test_commons_upload(self):
+        result = transform_object(436535, met_object, lookup=lookup)
+        self.assertEqual(result['upload']['filename'], 'Wheat Field with Cypresses - MET 1993.132.jpg')
+        self.assertEqual(result['upload']['description'], result['commons_template'])
+        self.assertIn('Wheat%20Field%20with%20Cypresses%20-%20MET%201993.132.jpg', result['url2commons_command'])
+        # Met data goes in literally, without regex escapes or further substitution
+        fields = {'title': r'\1 __medium__', 'medium': 'oil'}
+        self.assertEqual(render_commons_template(fields, '__title__|__medium__|__x__'), r'\1 __medium__|oil|')
+        self.assertEqual(commons_filename({'title': 'Plate: a/b [c]', 'accessionNumber': '1.2'}, 'http://x/a.JPG'),
+                         'Plate- a-b -c- - MET 1.2.jpg')
+        result = transform_object(1, dict(met_object, department='Unknown'), lookup=lookup)
+        self.assertIn('[[Category:Metropolitan Museum of Art]]', result['commons_template'])
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+
+# Met -> Wikidata transform. Takes a Met collection API object dict plus already loaded lookups
+# (crosswalk index, existing Wikidata matches) and returns structured statements, memo messages
+# and Commons upload data. Nothing in here does any HTTP, so it can be used by the web view,
+# batch jobs and benchmarks alike.
+
+import collections
+import os
+import re
+import urllib.parse
+
+from claims import claims_from_index
+from dates import parse_object_date
+from recon import best_match
+
+metdepartments = {
+    'American Decorative Arts': 'Q67429123',
+    'The American Wing': 'Q67429123',
+    'Ancient Near Eastern Art': 'Q67429126',
+    'Arms and Armor': 'Q67429127',
+    'Arts of Africa, Oceania, and the Americas': 'Q67429128',
+    'Asian Art': 'Q67429130',
+    'Costume Institute': 'Q67087093',
+    'Drawings and Prints': 'Q67429132',
+    'Egyptian Art': 'Q67429133',
+    'European Paintings': 'Q67429134',
+    'European Sculpture and Decorative Arts': 'Q67429136',
+    'Greek and Roman Art': 'Q67429137',
+    'Islamic Art': 'Q67429139',
+    'Medieval Art': 'Q67429140',
+    'Modern and Contemporary Art': 'Q67429142',
+    'Musical Instruments': 'Q67429143',
+    'Photographs': 'Q67429146',
+    'Robert Lehman Collection': 'Q67429147',
+    'The Cloisters': 'Q1138030',
+    'The Libraries': 'Q67429148'
+}
+
+# Commons categories for each department
+# From: https://commons.wikimedia.org/wiki/Category:Metropolitan_Museum_of_Art_by_department
+metdepartments_commons_category = {
+    'American Decorative Arts': 'Department of American Decorative Arts, Metropolitan Museum of Art',
+    'The American Wing': 'The American Wing Collection, Metropolitan Museum of Art',
+    'Ancient Near Eastern Art': 'Department of Ancient Near Eastern Art, Metropolitan Museum of Art',
+    'Arms and Armor': 'Department of Arms and Armor, Metropolitan Museum of Art',
+    'Arts of Africa, Oceania, and the Americas': 'Department of Arts of Africa, Oceania, and the Americas, Metropolitan Museum of Art',
+    'Asian Art': 'Department of Asian Art, Metropolitan Museum of Art',
+    'Costume Institute': 'Costume Institute, Metropolitan Museum of Art',
+    'Drawings and Prints': 'Department of Drawings and Prints, Metropolitan Museum of Art',
+    'Egyptian Art': 'Department of Egyptian Art, Metropolitan Museum of Art',
+    'European Paintings': 'Department of European Paintings, Metropolitan Museum of Art',
+    'European Sculpture and Decorative Arts': 'Department of European Sculpture and Decorative Arts, Metropolitan Museum of Art',
+    'Greek and Roman Art': 'Department of Greek and Roman Art, Metropolitan Museum of Art',
+    'Islamic Art': 'Department of Islamic Art, Metropolitan Museum of Art',
+    'Medieval Art': 'Department of Medieval Art, Metropolitan Museum of Art',
+    'Modern and Contemporary Art': 'Department of Modern and Contemporary Art, Metropolitan Museum of Art',
+    'Musical Instruments': 'Department of Musical Instruments, Metropolitan Museum of Art',
+    'Photographs': 'Department of Photographs, Metropolitan Museum of Art',
+    'Robert Lehman Collection': 'Robert Lehman Collection (Metropolitan Museum of Art)',
+    'The Cloisters': 'The Cloisters Collection, Metropolitan Museum of Art',
+    'The Libraries': 'Libraries Collection, Metropolitan Museum of Art'
+}
+default_commons_category = 'Metropolitan Museum of Art'  # For departments not listed above
+
+# Need OAuth to use this
+#   Options: urls and desc
+url2commons_url = 'https://tools.wmflabs.org/url2commons/index.html'
+commons_search_url = 'https://commons.wikimedia.org/w/index.php?sort=relevance&search={}&title=Special%3ASearch&profile=advanced&fulltext=1&advancedSearch-current=%7B%7D&ns0=1&ns6=1&ns14=1'
+
+default_object_name = 'object'  # If the objectName cannot be found, default to this
+
+commons_template_met = '''\
+=={{int:filedesc}}==
+{{Artwork
+ |artist             = __artist__
+ |author             = 
+ |title              = __title__
+ |description        = __description__
+ |object type        = __objectName__
+ |date               = __objectDate__
+ |medium             = __medium__
+ |dimensions         = __dimensions__
+ |institution        = {{Institution:Metropolitan Museum of Art}}
+ |department         = __department__
+ |accession number   = __accessionNumber__
+ |place of creation  = 
+ |place of discovery = 
+ |object history     = 
+ |exhibition history = 
+ |credit line        = __creditLine__
+ |inscriptions       = 
+ |notes              = 
+ |references         = 
+ |source             = __objectURL__{{Template:TheMet}}
+ |permission         = {{Cc-zero}}
+ |other_versions     = 
+ |wikidata           = __objectWikidata_URL__
+ |other_fields       = 
+}}
+[[Category:__department_commons_category__]]
+'''
+
+glamqid = 'Q160236'
+wikidata_pd = 'Q19652'
+
+# A statement without its subject, which is only known when rendering to Quickstatements.
+# Values are already in Quickstatements syntax, and qualifiers are (property, value) pairs
+Statement = collections.namedtuple('Statement', ['prop', 'value', 'qualifiers'])
+
+
+def statement(prop, value, *qualifiers):
+    return Statement(prop, value, tuple(qualifiers))
+
+
+def quote(value):
+    return '"{}"'.format(value)
+
+
+def quickstatement(subject, st):
+    return '|'.join([subject, st.prop, st.value] + [part for qualifier in st.qualifiers for part in qualifier])
+
+
+def quickstatements(result):
+    qs = ['CREATE'] if result['create'] else []
+    qs.extend(quickstatement(result['qs_subject'], st) for st in result['statements'])
+    return qs
+
+
+crosswalk_table = {
+    'wdLabel': lambda title: statement('Len', quote(title)),
+    'wdDescription': lambda description, accession: statement('Den', quote('{} (MET, {})'.format(description,
+                                                                                                accession))),
+    'wdLocation': lambda location: statement('P276', location),
+    'wdCommonsCompatible': lambda url: statement('P4765', quote(url)),
+    'wdCopyrightStatus': lambda status: statement('P6216', status, ('P459', 'Q61848113')),
+    'objectID': lambda objectid: statement('P3634', quote(objectid)),
+    'accessionNumber': lambda accession, collection: statement('P217', quote(accession), ('P195', collection)),
+    'collection': lambda collection, accession: statement('P195', collection, ('P217', quote(accession))),
+    'objectName': lambda instance: statement('P31', instance),
+    'objectDate': lambda date, *qualifiers: statement('P571', date, *qualifiers),
+    'isTimelineWork': lambda: statement('P1343', 'Q28837176'),
+    'artistDisplayName': lambda creator: statement('P170', creator),
+}
+
+
+# Whether the object needs a new item, already has one, or could not be checked/has several
+def match_status(result):
+    if result['qs_subject'] == 'UNCHECKED':
+        return 'unchecked'
+    if result['qs_subject'] == 'TOOMANY':
+        return 'duplicates'
+    return 'new' if result['create'] else 'existing'
+
+
+def _bare(value):
+    return value[1:-1] if len(value) > 1 and value[0] == value[-1] == '"' else value
+
+
+# Statements, or qualifiers of statements, that an existing item does not have yet. claims is in
+# the form of claims.claims_from_entity. Labels and descriptions are left alone once the item has
+# one, and where the qualifiers of a value are not known the statement is taken as present.
+def missing_statements(statements, claims):
+    missing = []
+    for st in statements:
+        existing = claims.get(st.prop)
+        if st.prop in ('Len', 'Den'):
+            if not existing:
+                missing.append(st)
+            continue
+        value = _bare(st.value)
+        if not existing or value not in existing:
+            missing.append(st)
+            continue
+        if existing[value] is None:
+            continue
+        # Quickstatements adds qualifiers to the existing statement with the same value
+        qualifiers = tuple(q for q in st.qualifiers if (q[0], _bare(q[1])) not in existing[value])
+        if qualifiers:
+            missing.append(Statement(st.prop, st.value, qualifiers))
+    return missing
+
+
+# Matches __field__ placeholders in commons_template_met
+_template_field_re = re.compile(r'__(\w+?)__')
+
+# Characters MediaWiki does not allow in page titles, replaced when building upload filenames
+_bad_filename_re = re.compile(r'[#<>\[\]|{}:/\\\x00-\x1f]+')
+
+# Commons limits file names to 240 bytes including the extension
+max_filename_bytes = 240
+
+
+# Fill in every __field__ placeholder of a template in one pass. Values go in literally, so
+# backslashes or placeholders inside Met data are left alone, and unknown fields become empty.
+def render_commons_template(fields, template=commons_template_met):
+    return _template_field_re.sub(lambda m: fields.get(m.group(1)) or '', template)
+
+
+# Field values for commons_template_met from a Met API object
+def commons_fields(data):
+    fields = {name: data.get(name) or '' for name in ('title', 'department', 'objectName', 'objectDate', 'medium',
+                                                     'dimensions', 'accessionNumber', 'creditLine', 'objectURL')}
+    if data.get('artistDisplayName'):
+        fields['artist'] = '{{{{Creator:{}}}}}'.format(data['artistDisplayName'])
+    if data.get('objectName'):
+        fields['description'] = downcasefunc(data['objectName'])
+        if data.get('culture'):
+            fields['description'] += '; ' + data['culture']
+    # See if there is Wikidata Q number from Met API
+    matched = re.search('.+(Q[0-9]+)$', data.get('objectWikidata_URL') or '')
+    fields['objectWikidata_URL'] = matched.group(1) if matched else ''
+    # Need to map department to Commons category
+    fields['department_commons_category'] = commons_category(data)
+    return fields
+
+
+def commons_category(data):
+    return metdepartments_commons_category.get(data.get('department'), default_commons_category)
+
+
+# Commons file name for an object's image, like "Wheat Field with Cypresses - MET 1993.132.jpg"
+def commons_filename(data, image_url):
+    extension = os.path.splitext(urllib.parse.urlsplit(image_url).path)[1].lower() or '.jpg'
+    suffix = ' - MET {}{}'.format(data.get('accessionNumber') or data.get('objectID'), extension)
+    title = ' '.join(_bad_filename_re.sub('-', data.get('title') or 'Untitled').split())
+    room = max_filename_bytes - len(suffix.encode('utf-8'))
+    title = title.encode('utf-8')[:room].decode('utf-8', 'ignore').rstrip()
+    return title + suffix
+
+
+# One line of a bulk upload manifest, for objects with a public domain image
+def upload_manifest_entry(id, data, image_url, description):
+    return {'id': id,
+            'url': image_url,
+            'filename': commons_filename(data, image_url),
+            'description': description,
+            'category': commons_category(data)}
+
+
+# Original fancy downcase function to turn Object Names like "Painting" to "painting"
+def downcasefunc(s):
+    return s.lower().replace('; ', '/') if isinstance(s, str) else default_object_name
+
+
+def transform_object(id, data, lookup=None, matches=None, checked=True, artist_candidates=None, claims=None):
+    # lookup is a crosswalk.CrosswalkLookup (None if the crosswalk could not be loaded), matches is
+    # {qid: {property: [values]}} of existing Wikidata items with this Met ID, checked is False
+    # if it could not be determined whether any exist, artist_candidates are the reconciliation
+    # results for artistDisplayName (None if it was not reconciled), and claims are the current
+    # claims of the existing item (None to go by the values in matches)
+    memo = []  # Set of messages to present to the user
+    statements = []
+    matches = matches or {}
+
+    qid = ''  # For storing existing qids
+    create = False
+    resultlist = sorted(matches)
+    for qid in resultlist:
+        memo.append('Found object ID in Wikidata: {}'.format(id))
+    if not checked:
+        # Unknown whether the item exists, so do not emit a CREATE that could duplicate it
+        qs_subject = 'UNCHECKED'
+        memo.append('Warning: could not check Wikidata for Met ID {} - statements have no subject'.format(id))
+    elif len(resultlist) > 0:
+        if len(resultlist) > 1:
+            qs_subject = 'TOOMANY'
+            memo.append(
+                'Warning: multiple existing items for Met ID {} - {} Wikidata item(s)'.format(id, len(resultlist)))
+        else:
+            qs_subject = qid
+            memo.append('Exact Wikidata match: {}'.format(qid))
+    else:
+        # No Wikidata item
+        # Start the Quickstatement with CREATE if this is a new item
+        create = True
+        # Use LAST as the subject the Quickstatement triples
+        qs_subject = 'LAST'
+        memo.append('Cleared for item creation: no Wikidata results returned for this object ID')
+
+    # Check to see if nothing comes back
+    if 'message' in data:
+        memo.append('Object ID not in use')
+    if 'title' in data:
+        statements.append(crosswalk_table['wdLabel'](data['title']))
+
+    if 'objectID' in data:
+        statements.append(crosswalk_table['objectID'](data['objectID']))
+    if 'accessionNumber' in data:
+        statements.append(crosswalk_table['accessionNumber'](data['accessionNumber'], glamqid))
+
+    if 'isTimelineWork' in data:
+        if data['isTimelineWork']:
+            # TODO - Add statement about TOAH
+            # item|P1343|Q28837176
+            statements.append(crosswalk_table['isTimelineWork']())
+            memo.append('Timeline work: should add statements')
+        else:
+            memo.append('Not timeline work')
+
+    # How the objectDate was read: a ParsedDate kind, 'complex' if it could not be parsed, or None
+    date_kind = None
+    if 'objectDate' in data:
+        incomingdate = data['objectDate']
+        parsed = parse_object_date(incomingdate)
+        if parsed:
+            date_kind = parsed.kind
+            statements.append(crosswalk_table['objectDate'](parsed.value, *parsed.qualifiers))
+            if parsed.kind != 'year':
+                memo.append('Date: Found {} date: {}'.format(parsed.kind, incomingdate))
+        elif incomingdate:
+            date_kind = 'complex'
+            memo.append('Date: Skipping since it is complex: ' + incomingdate)
+
+    # Grab images, first the large one for Commons, then a smaller display image
+    primary_img = None
+    if 'primaryImage' in data:
+        if data['primaryImage']:
+            primary_img = data['primaryImage']
+    display_img = primary_img
+    if 'primaryImageSmall' in data:
+        if data['primaryImageSmall']:
+            display_img = data['primaryImageSmall']
+
+    # Determine creator_string as real artist name, or generically "at the Met"
+    creator_string = " at the Metropolitan Museum of Art"
+    if 'artistDisplayName' in data:
+        if data['artistDisplayName']:
+            creator_string = " by {}".format(data['artistDisplayName'])
+        else:
+            memo.append('Creator: not specified from API, using generic Met Museum for description')
+
+    # Creator (P170) from the reconciled artist name, only if the match is confident
+    if artist_candidates is not None and data.get('artistDisplayName'):
+        artist_name = data['artistDisplayName']
+        creator = best_match(artist_candidates)
+        if creator:
+            statements.append(crosswalk_table['artistDisplayName'](creator['id']))
+            memo.append('Creator: matched "{}" to {} ({}, score {})'.format(artist_name, creator['id'],
+                                                                           creator.get('name'), creator['score']))
+        elif artist_candidates:
+            memo.append('Creator: no confident match for "{}", candidates: {}'.format(
+                artist_name, ', '.join('{} ({}, score {})'.format(c['id'], c.get('name'), c['score'])
+                                       for c in artist_candidates)))
+        else:
+            memo.append('Creator: no reconciliation candidates for "{}"'.format(artist_name))
+
+    # Add collection Met, accession_number
+    accession_number = None
+    if 'accessionNumber' in data:
+        accession_number = data['accessionNumber']
+        statements.append(crosswalk_table['collection'](glamqid, accession_number))
+        statements.append(crosswalk_table['wdLocation'](glamqid))
+
+    url2commons_command = None
+    commons_template = None
+    upload = None
+    if 'isPublicDomain' in data:
+        if data['isPublicDomain']:
+            # No image in the record (e.g. from the CSV dump, which has no image URLs)
+            if primary_img:
+                statements.append(crosswalk_table['wdCommonsCompatible'](primary_img))
+            statements.append(crosswalk_table['wdCopyrightStatus'](wikidata_pd))
+            # TODO add more metadata about CC0, use Maarten's guidelines
+            # https://www.wikidata.org/wiki/Q78609653
+            # file format, url, title, author name string, license, operator
+
+            # Fill in Artwork template for uploading to Commons, to be passed to url2commons
+            commons_template = render_commons_template(commons_fields(data))
+            if data.get('department') not in metdepartments_commons_category:
+                memo.append('Commons: no category for department "{}", using {}'.format(data.get('department'),
+                                                                                       default_commons_category))
+
+            # Craft the url2commons command to upload
+            if primary_img:
+                upload = upload_manifest_entry(id, data, primary_img, commons_template)
+                quoted_url = urllib.parse.quote(str.replace(primary_img, '_', '%5F'))
+                url2commons_command = url2commons_url + '?urls=' + quoted_url + ' ' + \
+                    urllib.parse.quote(upload['filename']) + '&desc=' + urllib.parse.quote(commons_template)
+            else:
+                memo.append('Public domain, but no image URL: Skip upload')
+
+        else:
+            # TODO - Add a message to main interface to say media is not free
+            memo.append('Not public domain: Skip upload, no free version')
+
+    # Setup the Commons search option, regardless of the PD status in case it's already in Commons
+    # Set the basic search string for Commons
+    commons_search_string = str(accession_number) + ' MET '
+    if 'title' in data:
+        if data['title']:
+            commons_search_string += data['title']
+    commons_search_command = commons_search_url.format(urllib.parse.quote_plus(commons_search_string))
+
+    if 'department' in data:
+        if data['department'] in metdepartments:
+            statements.append(crosswalk_table['collection'](metdepartments[data['department']],
+                                                            data['accessionNumber']))
+        else:
+            memo.append('Department: Skipped, none specified from API matched our crosswalk database')
+
+    # Perform sophisticated Object Name mappings
+    # TODO - take a look at classification as that is sometimes a better match
+    #   id 33 - objectName = bust; classification = glass
+    #   id 310175 - objectName = figure; classification = Stone-Sculpture
+    # Lookup instance info in crosswalk
+    entity_api_type = 'objectName'
+
+    # Craft the Check for objectName
+    if entity_api_type in data:
+
+        memo.append('Met object name: {}'.format(data['objectName']))
+
+        # Create description for Wikidata in the form of:
+        # "painting (French) by Claude Monet (MET, 12.34)"
+        if 'culture' in data and data['culture']:
+            culture_string = ' (' + data['culture'] + ')'
+        else:
+            culture_string = ''
+        wd_description = downcasefunc(data['objectName']) + culture_string + creator_string
+        statements.append(crosswalk_table['wdDescription'](wd_description, data['accessionNumber']))
+        entity = data[entity_api_type]
+        entity_lookup, exact_match = lookup.resolve(entity) if lookup is not None else (None, False)
+
+        entity_q = None
+        entity_extrastatement_q = None
+
+        if lookup is None:
+            memo.append('Object name: Skipped, crosswalk database unavailable')
+        elif entity_lookup is None:
+            memo.append('Failed: object name lookup for "{}"'.format(entity))
+            memo.append('Try adding object to crosswalk database: "{}"'.format('bitly link'))
+        else:
+            if not exact_match:
+                memo.append('Object name: matched crosswalk ignoring case/spacing for "{}"'.format(entity))
+            entity_q = entity_lookup.qid
+            entity_extrastatement_q = entity_lookup.extrastatement
+
+        if isinstance(entity_q, str):
+            statements.append(crosswalk_table[entity_api_type](entity_q))
+            if isinstance(entity_extrastatement_q, str):
+                statements.append(crosswalk_table[entity_api_type](entity_extrastatement_q))
+    else:
+        memo.append('Object name: Met did not specify. Skipped.')
+
+    # Only emit what an existing item is missing, so re-runs do not repeat edits
+    missing_only = bool(qid) and qs_subject == qid
+    if missing_only:
+        if claims is not None:
+            existing = claims
+        else:
+            # The index has no labels or descriptions, so take them as present rather than overwrite
+            # them, and the item was matched by this very Met ID
+            existing = dict(claims_from_index(matches[qid]), Len={'': None}, Den={'': None},
+                            P3634={str(id): None})
+        total = len(statements)
+        statements = missing_statements(statements, existing)
+        memo.append('Existing item: {} of {} statement(s) already on {}{}'.format(
+            total - len(statements), total, qid, '' if claims is not None else ' (indexed properties only)'))
+
+    result = {'id': id,
+              'qid': qid,
+              'qs_subject': qs_subject,
+              'create': create,
+              'statements': statements,
+              'missing_only': missing_only,
+              'memo': memo,
+              'date_kind': date_kind,
+              'img': display_img,
+              'primary_img': primary_img,
+              'commons_template': commons_template,
+              'url2commons_command': url2commons_command,
+              'upload': upload,
+              'commons_search_command': commons_search_command}
+    result['qs'] = quickstatements(result)
+    return result